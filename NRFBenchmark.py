@@ -0,0 +1,273 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Benchmarks for the 1D NRF Parameter Uncertainty Calculator - Python 2.7
+
+# Generates synthetic standalone.dat databases and material lists of a given size, runs each stage of the pipeline on
+# them separately and records its wall time and memory. Results can be saved as a JSON baseline and later runs
+# compared against it, flagging stages that got slower or used more memory than the tolerance allows
+# Memory is the peak traced allocation during the stage where tracemalloc exists (Python 3). Otherwise the stage is
+# run once more in a forked child, whose peak resident size (ru_maxrss) starts from the parent's current size rather
+# than its lifetime peak, and the growth of that peak is reported
+# Example:
+#    $./NRFBenchmark.py -lines=1000,100000 -isotopes=1,10,100 -save=baseline.json
+#    $./NRFBenchmark.py -lines=1000,100000 -isotopes=1,10,100 -compare=baseline.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+import resource
+
+import NRFmultiLine
+import NRFDatabase
+from NRFPipeline import NRFPipeline
+
+# Stages timed for every database, in the order they run
+stages = ['parse','cache_build','cache_load','materials','lookup','build_lines','source_strength','rank_pairs','compare','stream']
+# Lines of each database the pair finder is checked on against the all-pairs loop before anything is timed
+checkLines = 500
+
+# ------ ------ ------
+
+# Function to write a synthetic standalone.dat with nLines lines spread over the given isotopes
+# Levels have one to three branches, the first straight to the ground state, and some have no known width
+def write_database(fileName,nLines,isotopes,seed=0):
+    rng = np.random.RandomState(seed)
+    isotopes = np.asarray(isotopes,dtype=int).reshape(-1,2)
+    # Rows of the same level are consecutive: a new level starts with probability 1/2 after each row
+    newLevel = np.ones(nLines,dtype=bool)
+    newLevel[1:] = rng.random_sample(nLines-1) < 0.5
+    level = np.cumsum(newLevel) - 1
+    nLevels = level[-1] + 1 if nLines > 0 else 0
+    branch = np.arange(nLines) - np.flatnonzero(newLevel)[level]
+
+    levelIsotope = isotopes[rng.randint(len(isotopes),size=nLevels)]
+    levelE = np.round(rng.uniform(0.5,9.0,nLevels),6)
+    levelWidth = np.where(rng.random_sample(nLevels) < 0.8,rng.uniform(1e-9,3e-7,nLevels),0.0)
+    levelTDebye = rng.choice([0.0,105.0,420.0],nLevels)
+
+    Elevel = levelE[level]
+    Egamma = np.where(branch == 0,Elevel,np.round(Elevel*rng.uniform(0.3,0.95,nLines),6))
+    columns = [levelIsotope[level,0],levelIsotope[level,1],Elevel,Egamma,levelWidth[level],
+               rng.uniform(0.05,1,nLines),rng.uniform(0.05,1,nLines)[level] if nLines > 0 else [],
+               np.zeros(nLines),np.ones(nLines),levelTDebye[level]]
+    np.savetxt(fileName,np.column_stack(columns),fmt=['%d','%d','%.6f','%.6f','%.6g','%.4f','%.4f','%.1f','%.1f','%.1f'])
+
+# Function to write a material list for the isotopes, with random [warhead,foil] densities and fixed thicknesses
+def write_materials(fileName,isotopes,seed=0):
+    rng = np.random.RandomState(seed)
+    with open(fileName,'w') as matFile:
+        matFile.write('# Synthetic material list from NRFBenchmark\n# Format: "Z A numberdensity*A*1e-24"\n')
+        for z, a in isotopes:
+            nDens = rng.uniform(0.01,0.15)
+            matFile.write('%i %i %.5f %.5f 2.0 0.1\n' % (z,a,nDens,nDens))
+
+# Function to pick nIsotopes distinct isotopes, z = 1:100 to match the non-resonant table
+def make_isotopes(nIsotopes,seed=0):
+    if nIsotopes < 1 or nIsotopes > 100: raise ValueError("Number of isotopes must be between 1 and 100")
+    z = np.random.RandomState(seed).permutation(100)[:nIsotopes] + 1
+    return [[int(zi),int(round(zi*(2.0+0.6*zi/100.0)))] for zi in z]
+
+# ------ ------ ------
+
+# Function to run a stage repeat times, returning its last result, its fastest wall time and its memory (MB)
+def measure(function,repeat=1):
+    times = []
+    for i in range(repeat):
+        if tracemalloc != None and i == 0: tracemalloc.start()
+        start = time.time()
+        result = function()
+        times.append(time.time()-start)
+        if tracemalloc != None and i == 0:
+            memory = tracemalloc.get_traced_memory()[1] / 1048576.0
+            tracemalloc.stop()
+    if tracemalloc == None: memory = child_peak(function)
+    return result, min(times), memory
+
+# Function to find the growth of the peak resident size (MB) while function runs, in a forked child process
+# Forking gives the child a fresh high-water mark at the parent's current size, so even stages that allocate less than
+# the parent's earlier peak are seen. Where fork is missing the parent's own high-water mark is used instead
+def child_peak(function):
+    if not hasattr(os,'fork'):
+        rssBefore = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        function()
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rssBefore) / 1024.0 # kB on Linux
+    readEnd, writeEnd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(readEnd)
+        try:
+            rssBefore = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            sys.stdout = open(os.devnull,'w')
+            function()
+            os.write(writeEnd,repr((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rssBefore) / 1024.0))
+        except BaseException:
+            os.write(writeEnd,'nan')
+        finally:
+            os._exit(0)
+    os.close(writeEnd)
+    with os.fdopen(readEnd,'r') as pipe:
+        memory = float(pipe.read() or 'nan')
+    os.waitpid(pid,0)
+    return memory
+
+# Function to benchmark every stage on one synthetic database of nLines lines over nIsotopes isotopes
+# branchNeigh_compare keeps every pair, so it is only run up to compareLimit lines
+def run_case(nLines,nIsotopes,workDir,neighE=1e-4,repeat=1,compareLimit=100000,NRFile='nonResonantAttenuation.txt',seed=0):
+    isotopes = make_isotopes(nIsotopes,seed)
+    databaseFile = os.path.join(workDir,'standalone_%i_%i.dat' % (nLines,nIsotopes))
+    matFile = os.path.join(workDir,'matList_%i.txt' % nIsotopes)
+    write_database(databaseFile,nLines,isotopes,seed)
+    write_materials(matFile,isotopes,seed)
+    cacheDir = os.path.join(workDir,'cache_%i_%i' % (nLines,nIsotopes))
+    pipeline = NRFPipeline(databaseFile,NRFile,cacheDir)
+    EMin, EMax, bremsMin, bremsMax = 0.5, 9.0, 0.5, 9.5
+
+    records = []
+    def record(stage,function,times=repeat):
+        result, seconds, memory = measure(function,times)
+        records.append({'stage':stage, 'lines':nLines, 'isotopes':nIsotopes, 'seconds':seconds, 'memoryMB':memory})
+        return result
+
+    data = record('parse',lambda: NRFDatabase.read_standalone(databaseFile))
+    # Every build goes into a new directory, so the forked memory run builds the cache too instead of loading it
+    record('cache_build',lambda: NRFDatabase.load_standalone(databaseFile,tempfile.mkdtemp(prefix='cache',dir=workDir)),1)
+    NRFDatabase.load_standalone(databaseFile,cacheDir) # The cache the timed loads and the pipeline use
+    data = record('cache_load',lambda: np.array(NRFDatabase.load_standalone(databaseFile,cacheDir)))
+    # Timings of a wrong pair finder mean nothing: check it on no lines and on the first checkLines lines
+    for n in (0,min(checkLines,nLines)):
+        if not NRFmultiLine.check_pairs(data['Elevel'][:n],data['z'][:n],data['a'][:n],neighE):
+            raise ValueError("find_pairs disagrees with itertools.combinations on %i lines" % n)
+    matList, nDensList, thickList = NRFmultiLine.parse_materials(matFile)
+    materials = record('materials',lambda: pipeline.materials(matList,nDensList,thickList))
+    record('lookup',lambda: (NRFmultiLine.find_nearestE(data['Elevel'],pipeline.NREnergy),materials.NRMixture(data['Elevel'])))
+    emitList = record('build_lines',lambda: NRFmultiLine.build_lines(data,matList,nDensList,thickList,materials.NRMixture,EMin,EMax,bremsMin,bremsMax))
+    record('source_strength',lambda: NRFmultiLine.source_strength(emitList,matList) if len(emitList) > 0 else 1.0)
+    record('rank_pairs',lambda: NRFmultiLine.rank_pairs(emitList,neighE,5,5))
+    if nLines <= compareLimit:
+        record('compare',lambda: _quiet(NRFmultiLine.branchNeigh_compare,emitList,neighE,5,5,0))
+    record('stream',lambda: pipeline.stream(materials,EMin,EMax,bremsMin,bremsMax,neighE,5,5,max(1,nLines//8)))
+    return records
+
+# Run a function with its printed output thrown away
+def _quiet(function,*args):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull,'w')
+    try:
+        return function(*args)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+# Function to benchmark every combination of database sizes and isotope counts, in a temporary directory
+def run_benchmark(lineCounts,isotopeCounts,neighE=1e-4,repeat=1,compareLimit=100000,NRFile='nonResonantAttenuation.txt',seed=0):
+    NRFile = os.path.abspath(NRFile)
+    workDir = tempfile.mkdtemp(prefix='nrfbench')
+    records = []
+    try:
+        for nLines in lineCounts:
+            for nIsotopes in isotopeCounts:
+                records.extend(run_case(nLines,nIsotopes,workDir,neighE,repeat,compareLimit,NRFile,seed))
+    finally:
+        shutil.rmtree(workDir,ignore_errors=True)
+    return records
+
+# ------ ------ ------
+
+# Function to save benchmark records, with the versions they were taken with, as a JSON baseline
+def save_baseline(records,fileName):
+    baseline = {'python':platform.python_version(), 'numpy':np.__version__, 'machine':platform.machine(),
+                'memory':memory_method(), 'records':records}
+    with open(fileName,'w') as baselineFile:
+        json.dump(baseline,baselineFile,indent=1,sort_keys=True)
+
+# How memoryMB was measured. Figures taken different ways are not compared
+def memory_method():
+    if tracemalloc != None: return 'tracemalloc'
+    return 'fork_ru_maxrss' if hasattr(os,'fork') else 'ru_maxrss'
+
+def load_baseline(fileName):
+    with open(fileName,'r') as baselineFile:
+        return json.load(baselineFile)
+
+# Function to compare records against a baseline
+# Returns (stage, lines, isotopes, seconds, baseline seconds, memory, baseline memory, regressed) for every case in both,
+# where regressed is 'time' if the stage is more than tolerance slower (0.2 = 20%) and slower by more than minSeconds,
+# 'memory' if it used more than tolerance more memory and more by over minMB, 'time+memory' for both, otherwise ''
+# Memory is only compared when the baseline measured it the same way, otherwise its baseline memory is nan
+def compare(records,baseline,tolerance=0.2,minSeconds=1e-3,minMB=1.0):
+    base = dict(((r['stage'],r['lines'],r['isotopes']),r) for r in baseline['records'])
+    sameMemory = baseline.get('memory') == memory_method()
+    rows = []
+    for r in records:
+        key = (r['stage'],r['lines'],r['isotopes'])
+        if key not in base: continue
+        baseSeconds = base[key]['seconds']
+        baseMemory = base[key]['memoryMB'] if sameMemory else float('nan')
+        regressed = []
+        if r['seconds'] > (1+tolerance)*baseSeconds and r['seconds']-baseSeconds > minSeconds: regressed.append('time')
+        if r['memoryMB'] > (1+tolerance)*baseMemory and r['memoryMB']-baseMemory > minMB: regressed.append('memory')
+        rows.append(key + (r['seconds'],baseSeconds,r['memoryMB'],baseMemory,'+'.join(regressed)))
+    return rows
+
+# Function to format benchmark records as a printed table
+def format_records(records):
+    report = ['%-16s %9s %9s %12s %12s' % ('stage','lines','isotopes','seconds','memory[MB]')]
+    for r in records:
+        report.append('%-16s %9i %9i %12.5f %12.2f' % (r['stage'],r['lines'],r['isotopes'],r['seconds'],r['memoryMB']))
+    return '\n'.join(report) + '\n'
+
+def format_comparison(rows):
+    report = ['%-16s %9s %9s %12s %12s %12s %12s' % ('stage','lines','isotopes','seconds','baseline','memory[MB]','baseline')]
+    for stage, nLines, nIsotopes, seconds, baseSeconds, memory, baseMemory, regressed in rows:
+        flag = '  ' + regressed.replace('time','SLOWER').replace('memory','LARGER') if regressed else ''
+        report.append('%-16s %9i %9i %12.5f %12.5f %12.2f %12.2f%s' % (stage,nLines,nIsotopes,seconds,baseSeconds,memory,baseMemory,flag))
+    return '\n'.join(report) + '\n'
+
+# ------ ------ ------
+
+def _int_list(text):
+    return [int(float(value)) for value in text.split(',')]
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Times each stage of the NRF pipeline on synthetic databases and compares the times against a saved baseline. \nExample:\
+        .......................................................................\
+        $./NRFBenchmark.py -lines=1000,100000 -isotopes=1,10,100 -save=baseline.json \
+        .......................................................................')
+    parser.add_argument('-lines', help='Comma separated database sizes (lines), default = 1000,10000 ', type=_int_list, default=[1000,10000])
+    parser.add_argument('-isotopes', help='Comma separated numbers of isotopes (1 to 100), default = 1,10 ', type=_int_list, default=[1,10])
+    parser.add_argument('-neighE', help='Energy gap to qualify as neighbours (MeV), default = 0.1KeV ', type=float, default=1e-4)
+    parser.add_argument('-repeat', help='Times each stage is repeated, the fastest is kept, default = 3 ', type=int, default=3)
+    parser.add_argument('-compareLimit', help='Largest database branchNeigh_compare is run on, default = 100000 ', type=int, default=100000)
+    parser.add_argument('-NRFile', help='Non-resonant attenuation table, default = nonResonantAttenuation.txt ', type=str, default='nonResonantAttenuation.txt')
+    parser.add_argument('-save', help='Save the results as a JSON baseline to this file ', type=str)
+    parser.add_argument('-compare', help='Compare the results against the JSON baseline in this file ', type=str)
+    parser.add_argument('-tolerance', help='Fractional slowdown or memory growth flagged as a regression, default = 0.2 ', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.repeat < 1: sys.exit("Number of repeats must be positive")
+    try:
+        records = run_benchmark(args.lines,args.isotopes,args.neighE,args.repeat,args.compareLimit,args.NRFile)
+    except ValueError as error:
+        sys.exit("\n%s" % error)
+    sys.stdout.write(format_records(records))
+
+    if args.save != None:
+        save_baseline(records,args.save)
+        print("Baseline saved to %s" % args.save)
+    if args.compare != None:
+        rows = compare(records,load_baseline(args.compare),args.tolerance)
+        sys.stdout.write('\n' + format_comparison(rows))
+        nRegressed = sum(1 for row in rows if row[-1])
+        if nRegressed > 0: sys.exit("%i stages slower or larger than the baseline" % nRegressed)
@@ -0,0 +1,282 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Loaders for the NRF line and non-resonant attenuation databases - Python 2.7
+
+import numpy as np
+import os
+import json
+import csv
+import hashlib
+import itertools
+
+import NRFInstrument
+
+# Columns of standalone.dat, in file order. Any further columns in the file are ignored
+standaloneFields = ['z','a','Elevel','Egamma','Width','prob','GSprob','J0','Jr','TDebye']
+standaloneDtype = np.dtype([('z',np.int32),('a',np.int32)] + [(field,float) for field in standaloneFields[2:]])
+
+# ------ ------ ------
+
+# Function to read the whole standalone.dat database in one pass into a structured array, one record per line
+def read_standalone(fileName):
+    with open(fileName,'r') as dataFile:
+        text = dataFile.read()
+    return _standalone_array(_parse_columns(text,fileName,len(standaloneFields)),fileName)
+
+def _standalone_array(values,fileName,firstRow=0):
+    data = np.empty(len(values),dtype=standaloneDtype)
+    for i, field in enumerate(standaloneFields):
+        data[field] = values[:,i]
+    if np.any(data['z'] != values[:,0]) or np.any(data['a'] != values[:,1]):
+        bad = np.flatnonzero((data['z'] != values[:,0]) | (data['a'] != values[:,1]))[0]
+        raise ValueError('read_standalone ERROR: \n%s row %i has non-integer Z or A' % (fileName,firstRow+bad+1))
+    return data
+
+# Generator reading standalone.dat chunkLines rows at a time, yielding one structured array per chunk
+# Only one chunk of the file is held in memory at once
+def iter_standalone(fileName,chunkLines=1<<16):
+    with open(fileName,'r') as dataFile:
+        firstRow = 0
+        while True:
+            rows = list(itertools.islice(dataFile,chunkLines))
+            if len(rows) == 0: break
+            yield _standalone_array(_parse_columns(''.join(rows),fileName,len(standaloneFields),firstRow),fileName,firstRow)
+            firstRow += len(rows)
+
+# Parse whitespace separated numeric text into a (rows, columns) float array with a single C-level conversion
+# Every row must have the same number of columns, at least minColumns, otherwise the first bad row is reported
+# firstRow is the number of file rows before this text, so chunks report rows by their place in the whole file
+def _parse_columns(text,fileName,minColumns,firstRow=0):
+    rows = [row for row in text.splitlines() if row.strip()]
+    if len(rows) == 0:
+        return np.empty((0,minColumns))
+    nColumns = len(rows[0].split())
+
+    values = np.fromstring(text,dtype=float,sep=' ')
+    if nColumns < minColumns or values.size != len(rows)*nColumns:
+        # Only walk the rows one by one once we know something is wrong with them
+        for i, row in enumerate(rows):
+            tokens = row.split()
+            if len(tokens) != nColumns or len(tokens) < minColumns:
+                raise ValueError('%s ERROR: \nrow %i has %i columns, expected %i: %r' % (fileName,firstRow+i+1,len(tokens),max(nColumns,minColumns),row))
+            try:
+                [float(token) for token in tokens]
+            except ValueError:
+                raise ValueError('%s ERROR: \nrow %i is not numeric: %r' % (fileName,firstRow+i+1,row))
+        raise ValueError('%s ERROR: \ncould not parse file as %i numeric columns' % (fileName,nColumns))
+    return values.reshape(len(rows),nColumns)
+
+# Function to read the pipe-delimited nonResonantAttenuation.txt table: one column of energies, then isotopes z = 1:100
+def read_nonresonant(fileName):
+    with open(fileName,'r') as dataFile:
+        text = dataFile.read()
+    return _parse_columns(text.replace('|',' '),fileName,2)
+
+# Columns of the Mathematica CSV export (mathematicaexport1.csv), in file order. Any further columns are ignored
+mathematicaFields = ['z','a','e_level','e_gamma','t_half','level_width','brj','br0','j0','jr','sigma_int']
+# Export column giving each standalone.dat field. The export has no Debye temperatures, so TDebye is 0 (free nuclei)
+mathematicaColumns = {'z':'z', 'a':'a', 'Elevel':'e_level', 'Egamma':'e_gamma', 'Width':'level_width',
+                      'prob':'brj', 'GSprob':'br0', 'J0':'j0', 'Jr':'jr'}
+hbar = 6.582119e-22 # MeV s
+
+# Function to read the Mathematica CSV export in one pass into the same structured array as read_standalone
+# Missing or non-numeric values become nan (and are then rejected by the line filters). A level with no width
+# but a half-life gets Width = hbar*ln(2)/t_half. A header row, if there is one, is skipped
+def read_mathematica(fileName):
+    with open(fileName,'r') as csvFile:
+        rows = [row[:len(mathematicaFields)] for row in csv.reader(csvFile) if len(row) > 0]
+    if len(rows) > 0 and not _is_number(rows[0][0]): rows = rows[1:]
+    for i, row in enumerate(rows):
+        if len(row) < len(mathematicaFields):
+            raise ValueError('%s ERROR: \nrow %i has %i columns, expected %i: %r' % (fileName,i+1,len(row),len(mathematicaFields),','.join(row)))
+    text = np.array(rows,dtype=str).reshape(-1,len(mathematicaFields))
+    columns = dict((field,_float_column(text[:,i])) for i, field in enumerate(mathematicaFields))
+
+    Width = columns['level_width']
+    with np.errstate(invalid='ignore'):
+        fromHalfLife = ~(Width > 0) & (columns['t_half'] > 0)
+    Width[fromHalfLife] = hbar*np.log(2)/columns['t_half'][fromHalfLife]
+
+    data = np.zeros(len(text),dtype=standaloneDtype)
+    for field in standaloneFields[:-1]:
+        data[field] = columns[mathematicaColumns[field]]
+    if np.any(data['z'] != columns['z']) or np.any(data['a'] != columns['a']):
+        bad = np.flatnonzero((data['z'] != columns['z']) | (data['a'] != columns['a']))[0]
+        raise ValueError('read_mathematica ERROR: \n%s row %i has non-integer Z or A' % (fileName,bad+1))
+    return data
+
+# Convert a column of strings to floats, with nan for any entry that is not a number
+def _float_column(strings):
+    try:
+        return strings.astype(float)
+    except ValueError:
+        return np.array([float(value) if _is_number(value) else np.nan for value in strings])
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+# ------ ------ ------
+
+# Binary cache of the parsed databases
+# Each source file is parsed once into a .npy file in cacheDir (default: .nrfcache next to the source) and
+# memory-mapped read-only on later runs. The cache is keyed on the source's size, mtime and SHA-1, and is
+# rebuilt automatically when the source changes. If the cache can't be written the parsed data is returned as-is
+cacheVersion = 1
+
+def load_standalone(fileName,cacheDir=None,useCache=True):
+    if not useCache: return read_standalone(fileName)
+    return load_cached(fileName,read_standalone,cacheDir)
+
+def load_mathematica(fileName,cacheDir=None,useCache=True):
+    if not useCache: return read_mathematica(fileName)
+    return load_cached(fileName,read_mathematica,cacheDir)
+
+# Function to load a line database in either format: a .csv file is taken to be the Mathematica export
+def load_database(fileName,cacheDir=None,useCache=True):
+    if is_mathematica(fileName): return load_mathematica(fileName,cacheDir,useCache)
+    return load_standalone(fileName,cacheDir,useCache)
+
+def is_mathematica(fileName):
+    return os.path.splitext(fileName)[1].lower() == '.csv'
+
+# Returns the energy grid and the (energies, 100) matrix of non-resonant cross sections
+def load_nonresonant(fileName,cacheDir=None,useCache=True):
+    table = load_cached(fileName,read_nonresonant,cacheDir) if useCache else read_nonresonant(fileName)
+    return table[:,0], table[:,1:]
+
+def load_cached(fileName,parser,cacheDir=None):
+    if cacheDir == None:
+        cacheDir = os.path.join(os.path.dirname(os.path.abspath(fileName)),'.nrfcache')
+    cacheName = os.path.join(cacheDir,'%s.%s.npy' % (os.path.basename(fileName),parser.__name__))
+    metaName = cacheName + '.json'
+
+    stat = os.stat(fileName)
+    source = {'version':cacheVersion, 'size':stat.st_size, 'mtime':stat.st_mtime}
+    try:
+        with open(metaName,'r') as metaFile:
+            meta = json.load(metaFile)
+    except (IOError,OSError,ValueError):
+        meta = None
+
+    if meta != None and os.path.exists(cacheName) and meta.get('version') == cacheVersion:
+        if meta.get('size') == source['size'] and meta.get('mtime') == source['mtime']:
+            return np.load(cacheName,mmap_mode='r')
+        # Size or mtime changed: only rebuild if the contents actually differ
+        source['sha1'] = _file_hash(fileName)
+        if meta.get('sha1') == source['sha1']:
+            _write_meta(metaName,source)
+            return np.load(cacheName,mmap_mode='r')
+
+    data = parser(fileName)
+    if 'sha1' not in source: source['sha1'] = _file_hash(fileName)
+    try:
+        if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+        tempName = cacheName + '.%i.tmp' % os.getpid()
+        with open(tempName,'wb') as cacheFile:
+            np.save(cacheFile,data)
+        os.rename(tempName,cacheName)
+        _write_meta(metaName,source)
+    except (IOError,OSError):
+        return data
+    return np.load(cacheName,mmap_mode='r')
+
+def _write_meta(metaName,source):
+    tempName = metaName + '.%i.tmp' % os.getpid()
+    with open(tempName,'w') as metaFile:
+        json.dump(source,metaFile)
+    os.rename(tempName,metaName)
+
+def _file_hash(fileName):
+    digest = hashlib.sha1()
+    with open(fileName,'rb') as dataFile:
+        for block in iter(lambda: dataFile.read(1<<20),b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# ------ ------ ------
+
+# Boolean masks for each of the line selection criteria, for lines in a standalone database array
+def filter_masks(data,matList,EMin,EMax,bremsMin,bremsMax):
+    Width = data['Width']
+    Egamma = data['Egamma']
+    return [('Width', (Width>0) & ~np.isinf(Width)),
+            ('prob', data['prob']>0),
+            ('isotope', np.in1d(_isotope_key(data['z'],data['a']),_isotope_key(*np.asarray(matList,dtype=int).reshape(-1,2).T))),
+            ('EMin', Egamma>EMin),
+            ('EMax', Egamma<EMax),
+            ('bremsMin', data['Elevel']>bremsMin),
+            ('bremsMax', Egamma<bremsMax)]
+
+# Function to select the lines with valid data, inside the energy ranges and on the material list
+# Returns the accepted records and the position of each one's isotope in matList
+# instrument counts the lines each criterion accepts and rejects
+def filter_lines(data,matList,EMin,EMax,bremsMin,bremsMax,instrument=NRFInstrument.disabled):
+    masks = filter_masks(data,matList,EMin,EMax,bremsMin,bremsMax)
+    instrument.count_filters(masks)
+    keep = np.ones(len(data),dtype=bool)
+    for criterion, mask in masks:
+        keep &= mask
+    lines = data[keep]
+    return lines, isotope_index(lines['z'],lines['a'],matList)
+
+# Position of each (z, a) in matList, taking the first entry if an isotope is listed twice
+def isotope_index(z,a,matList):
+    matKeys = _isotope_key(*np.asarray(matList,dtype=int).reshape(-1,2).T)
+    sorter = np.argsort(matKeys,kind='mergesort')
+    return sorter[np.searchsorted(matKeys,_isotope_key(z,a),sorter=sorter)]
+
+def _isotope_key(z,a):
+    return np.asarray(z,dtype=np.int64)*1000 + np.asarray(a,dtype=np.int64)
+
+# ------ ------ ------
+
+# Index over a line database sorted by isotope, then Elevel
+# Each isotope's lines are one contiguous block, found from the (z, a) -> (start, stop) dict in constant time, and
+# a second index holds every line in Elevel order for energy window lookups
+# Example:
+#    index = NRFLineIndex(NRFDatabase.load_mathematica('mathematicaexport1.csv'))
+#    index.isotope(92,238), index.select(matList), index.energy_range(2.0,2.5)
+class NRFLineIndex(object):
+    def __init__(self, _data):
+        data = np.asarray(_data)
+        order = np.lexsort((data['Elevel'],data['a'],data['z']))
+        self.data = data if np.all(order == np.arange(len(data))) else data[order]
+        # Start of each isotope's block and the block's (z, a)
+        key = _isotope_key(self.data['z'],self.data['a'])
+        starts = np.flatnonzero(np.concatenate(([True],key[1:] != key[:-1]))) if len(key) > 0 else np.zeros(0,dtype=int)
+        stops = np.append(starts[1:],len(key))
+        self.ranges = dict(((int(self.data['z'][start]),int(self.data['a'][start])),(int(start),int(stop))) for start, stop in zip(starts,stops))
+        self.ElevelOrder = np.argsort(self.data['Elevel'],kind='mergesort')
+        self.ElevelSorted = self.data['Elevel'][self.ElevelOrder]
+
+    def __len__(self):
+        return len(self.data)
+
+    # The isotopes in the database, in (z, a) order
+    def isotopes(self):
+        return sorted(self.ranges)
+
+    # The lines of one isotope, as a slice of the sorted data (empty if it has none)
+    def isotope(self, z, a):
+        start, stop = self.ranges.get((int(z),int(a)),(0,0))
+        return self.data[start:stop]
+
+    # The lines of every isotope in matList, in matList order, ready for filter_lines / build_lines
+    def select(self, matList):
+        blocks = []
+        for z, a in matList:
+            block = self.ranges.get((int(z),int(a)))
+            if block != None and block not in blocks: blocks.append(block) # An isotope listed twice is only taken once
+        if len(blocks) == 1: return self.data[blocks[0][0]:blocks[0][1]]
+        if len(blocks) == 0: return self.data[:0]
+        return np.concatenate([self.data[start:stop] for start, stop in blocks])
+
+    # The lines with EMin <= Elevel < EMax, in Elevel order
+    def energy_range(self, EMin, EMax):
+        start, stop = np.searchsorted(self.ElevelSorted,[EMin,EMax],side='left')
+        return self.data[self.ElevelOrder[start:stop]]
@@ -10,6 +10,8 @@
 
 import math
 
+from NRFProfile import effective_temperature
+
 # Build quick class structure
 class NRFGamma:
     def __init__(self, _z, _a, _Elevel, _Egamma, _Width, _prob, _GSprob, _J0, _Jr, _TDebye, _nDens, _thickness, _sigmaNRLevel, _sigmaNRGamma, _counter):
@@ -36,7 +38,7 @@ class NRFGamma:
         # and the Doppler-broadened peak height
         Mc2 = self.a * 931.454 # MeV
         kB = 8.6173e-11 # MeV/K
-        self.Delta = self.Elevel * math.sqrt(2*kB*300.0/Mc2) # FIXME this should use Teff
+        self.Delta = self.Elevel * math.sqrt(2*kB*float(effective_temperature(self.TDebye,300.0))/Mc2) # Debye effective temperature, as NRFLineTable
         self.sigmaDmax = 1.0e28 * 2.0 * (math.pi)**(3.0/2.0) * g * (hbarc/self.Elevel)**2 * self.prob * self.GSprob * self.Width / self.Delta # b
         
         # Calculate the alpha factor : mu_NRF(Elevel) + mu_NR(Elevel) + 2*mu_NR(Egamma) [Warhead,Foil]
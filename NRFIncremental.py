@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Incremental rescans for changed number densities and thicknesses - Python 2.7
+
+# While the isotopes, energy windows and neighbour gap stay fixed, which lines pass the filters, which of them pair up,
+# where their energies fall on the non-resonant grid, their source flux and Doppler widths never change
+# An NRFIncrementalScan works all of that out once. Each evaluate() then only rebuilds the mixture attenuation curve,
+# reads it at the kept grid brackets, rescales the density-dependent line columns and reranks the pairs
+# The pairs themselves are not kept, only the O(lines) sorted orders and window ends that describe them, so each
+# evaluate() expands them again a block at a time and memory grows with the lines and pairs ranked, not every pair
+# Example:
+#    scan = pipeline.prepare('matList.txt',EMin=1,EMax=2.5,bremsMin=2,bremsMax=9,neighE=0.01)
+#    result = scan.evaluate(nDensList,thickList,numBranch=5,numNeigh=5)
+#    result = scan.evaluate_file('matList.txt',5,5)    # after editing only the densities or thicknesses
+
+import numpy as np
+
+import NRFmultiLine
+import NRFDatabase
+import NRFPipeline
+
+# ------ ------ ------
+
+class NRFIncrementalScan(object):
+    # pipeline is the NRFPipeline holding the databases, materials an NRFMaterials fixing the isotopes
+    def __init__(self, pipeline, materials, EMin, EMax, bremsMin, bremsMax, neighE, blockSize=1<<16):
+        self.pipeline = pipeline
+        self.matList = [list(isotope) for isotope in materials.matList]
+        self.NRMixture = materials.NRMixture
+        self.params = {'EMin':EMin, 'EMax':EMax, 'bremsMin':bremsMin, 'bremsMax':bremsMax, 'neighE':neighE}
+        self.blockSize = blockSize
+        self.nDensList, self.thickList = materials.nDensList, materials.thickList
+
+        # Lines and their isotopes' positions in matList, built once with the starting densities
+        self.emitList = NRFmultiLine.build_lines(pipeline.lines_for(self.matList),self.matList,self.nDensList,self.thickList,self.NRMixture,
+                                                 EMin,EMax,bremsMin,bremsMax,pipeline.instrument)
+        self.isoIndex = NRFDatabase.isotope_index(self.emitList.z,self.emitList.a,self.matList)
+        # Grid brackets of each line's energies on the non-resonant table
+        self.levelBracket = self.NRMixture.bracket(self.emitList.Elevel)
+        self.gammaBracket = self.NRMixture.bracket(self.emitList.Egamma)
+        # Sorted orders and window ends describing every branched and neighbouring pair of emitList
+        with pipeline.instrument.stage('pair_structure',len(self.emitList)):
+            self.pairWindows = NRFmultiLine.pair_windows(self.emitList.Elevel,self.emitList.z,self.emitList.a,neighE)
+
+    # Function to rescan with new [warhead,foil] number densities and thicknesses, one row per isotope in matList order
+    # Either can be None to keep the current values. Returns an NRFScanResult like NRFPipeline.run
+    def evaluate(self, nDensList=None, thickList=None, numBranch=None, numNeigh=None):
+        if nDensList is None: nDensList = self.nDensList
+        if thickList is None: thickList = self.thickList
+        nDens = np.asarray(nDensList,dtype=float).reshape(-1,2)
+        thickness = np.asarray(thickList,dtype=float).reshape(-1,2)
+        if len(nDens) != len(self.matList) or len(thickness) != len(self.matList):
+            raise ValueError("Material input incorrect: need one number density and thickness row per isotope in the prepared scan")
+        instrument = self.pipeline.instrument
+
+        with instrument.stage('rescale',len(self.emitList)):
+            # The mixture curve is a (grid x isotopes) by (isotopes x 2) product, read at the kept brackets
+            mixture = self.NRMixture.sorted_data(NRFmultiLine.mixture_attenuation(self.pipeline.NRData,self.matList,nDens))
+            sigmaNRLevel = self.NRMixture.interpolate(self.levelBracket[0],self.levelBracket[1],mixture)
+            sigmaNRGamma = self.NRMixture.interpolate(self.gammaBracket[0],self.gammaBracket[1],mixture)
+            emitList = self.emitList.rescaled(nDens[self.isoIndex],thickness[self.isoIndex],sigmaNRLevel,sigmaNRGamma)
+
+        with instrument.stage('source_strength',len(emitList)):
+            sourceStrength = NRFmultiLine.source_strength(emitList,self.matList) if len(emitList) > 0 else 1.0
+            emitList.counts = emitList.counts*sourceStrength
+
+        with instrument.stage('rank_pairs') as stage:
+            blocks = NRFmultiLine.pair_blocks(self.pairWindows,self.emitList.Elevel,self.params['neighE'],self.blockSize)
+            (branchPairs, branchCounts, nBranch), (neighPairs, neighCounts, nNeigh) = NRFmultiLine.rank_pair_blocks(blocks,emitList.counts,emitList.index,numBranch,numNeigh)
+            stage.items = nBranch + nNeigh
+        return NRFPipeline.NRFScanResult(self.params,emitList,sourceStrength,branchPairs,branchCounts,nBranch,neighPairs,neighCounts,nNeigh)
+
+    # Function to rescan with the densities and thicknesses of an edited material file
+    # The file must list the same isotopes in the same order as the one the scan was prepared with
+    def evaluate_file(self, matFile, numBranch=None, numNeigh=None):
+        matList, nDensList, thickList = NRFmultiLine.parse_materials(matFile)
+        if matList != self.matList:
+            raise ValueError("Material input changed isotopes: prepare the scan again when the isotope list changes")
+        return self.evaluate(nDensList,thickList,numBranch,numNeigh)
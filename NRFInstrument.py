@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Stage timers and counters for the NRF pipeline - Python 2.7
+
+# An NRFInstrument records the wall time, number of calls and number of items handled by each stage of a scan,
+# free-form counters, and the lines accepted and rejected by each line selection criterion
+# When disabled every call returns straight away, and stages hand back one shared do-nothing context, so an
+# instrument can be threaded through the pipeline and left off at no real cost
+# Example:
+#    instrument = NRFInstrument()
+#    with instrument.stage('filter') as stage:
+#        ...
+#        stage.items = len(lines)
+#    print instrument.to_json()
+
+import json
+import timeit
+import cProfile
+import pstats
+
+# ------ ------ ------
+
+class NRFInstrument(object):
+    def __init__(self, enabled=True, profile=False):
+        self.enabled = enabled
+        self.startTime = timeit.default_timer()
+        self.stages = {}      # name -> [calls, seconds, items]
+        self.stageOrder = []
+        self.counters = {}
+        self.filters = {}     # criterion -> [accepted, rejected]
+        self.filterOrder = []
+        # cProfile capture is only switched on between enable_profile and disable_profile
+        self.profiler = cProfile.Profile() if enabled and profile else None
+
+    # Context manager timing one call of a stage. Set .items on it to record how many items the call handled
+    def stage(self, name, items=0):
+        if not self.enabled: return _noStage
+        return _Stage(self,name,items)
+
+    def add_stage(self, name, seconds, items=0):
+        if name not in self.stages:
+            self.stages[name] = [0,0.0,0]
+            self.stageOrder.append(name)
+        totals = self.stages[name]
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] += items
+
+    def count(self, name, n=1):
+        if not self.enabled: return
+        self.counters[name] = self.counters.get(name,0) + n
+
+    # Count the lines each selection criterion accepts and rejects, from (criterion, mask) pairs applied in order
+    # A line is only counted as rejected by the first criterion it fails
+    def count_filters(self, masks):
+        if not self.enabled: return
+        remaining = None
+        for criterion, mask in masks:
+            if criterion not in self.filters:
+                self.filters[criterion] = [0,0]
+                self.filterOrder.append(criterion)
+            kept = mask if remaining is None else remaining & mask
+            self.filters[criterion][0] += int(kept.sum())
+            self.filters[criterion][1] += int(mask.size - kept.sum()) if remaining is None else int(remaining.sum() - kept.sum())
+            remaining = kept
+
+    def enable_profile(self):
+        if self.profiler != None: self.profiler.enable()
+
+    def disable_profile(self):
+        if self.profiler != None: self.profiler.disable()
+
+    # Function to save the raw cProfile statistics, for pstats or snakeviz
+    def dump_profile(self, fileName):
+        if self.profiler != None: self.profiler.dump_stats(fileName)
+
+    # Structured report of everything recorded so far
+    def report(self, profileTop=20):
+        report = {'wallSeconds':timeit.default_timer() - self.startTime,
+                  'stages':[{'name':name, 'calls':self.stages[name][0], 'seconds':self.stages[name][1], 'items':self.stages[name][2]} for name in self.stageOrder],
+                  'counters':dict(self.counters),
+                  'filters':[{'criterion':criterion, 'accepted':self.filters[criterion][0], 'rejected':self.filters[criterion][1]} for criterion in self.filterOrder]}
+        if self.profiler != None: report['profile'] = _profile_rows(self.profiler,profileTop)
+        return report
+
+    def to_json(self, profileTop=20):
+        return json.dumps(self.report(profileTop),indent=1,sort_keys=True)
+
+# One timed call of a stage
+class _Stage(object):
+    __slots__ = ('instrument','name','items','start')
+
+    def __init__(self, instrument, name, items):
+        self.instrument = instrument
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.instrument.add_stage(self.name,timeit.default_timer()-self.start,self.items)
+        return False
+
+# Stand-in for _Stage when instrumentation is off: no timing, and setting items does nothing
+class _NoStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_noStage = _NoStage()
+
+# Instrument used when none is given: always off
+disabled = NRFInstrument(False)
+
+# The profileTop functions with the largest cumulative time
+def _profile_rows(profiler,profileTop):
+    stats = pstats.Stats(profiler).stats
+    rows = [{'function':'%s:%i(%s)' % function, 'calls':calls, 'totalSeconds':totalTime, 'cumulativeSeconds':cumulativeTime}
+            for function, (primitiveCalls, calls, totalTime, cumulativeTime, callers) in stats.items()]
+    rows.sort(key=lambda row: -row['cumulativeSeconds'])
+    return rows[:profileTop]
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Columnar table of NRF lines - Python 2.7
+# Same physics as the NRFGamma class, evaluated for every line at once, with Delta from the Debye effective temperature
+# Derived from the NRFGamma class (Jayson Vavrek, Ruaridh Macdonald), whose physics it ports
+
+import copy
+import numpy as np
+
+from NRFProfile import effective_temperature
+
+hbarc = 197.327e-15 # MeV m
+amu   = 931.454     # MeV
+kB    = 8.6173e-11  # MeV/K
+
+# Build a structure-of-arrays table: one array per field, [warhead,foil] fields are (n,2) arrays
+class NRFLineTable(object):
+    # Fields holding one value per line
+    scalarFields = ('z','a','Elevel','Egamma','Width','prob','GSprob','J0','Jr','TDebye','Delta','sigmaDmax','flux','counts')
+    # Fields holding a [warhead,foil] pair per line
+    layerFields  = ('nDens','thickness','sigmaInt','sigmaNRLevel','sigmaNRGamma','alpha')
+
+    def __init__(self, _z, _a, _Elevel, _Egamma, _Width, _prob, _GSprob, _J0, _Jr, _TDebye, _nDens, _thickness, _sigmaNRLevel, _sigmaNRGamma, _flux=1.0):
+        self.z      = np.asarray(_z,dtype=np.int32)
+        self.a      = np.asarray(_a,dtype=np.int32)
+        self.Elevel = np.asarray(_Elevel,dtype=float)  # Energy of the resonant level
+        self.Egamma = np.asarray(_Egamma,dtype=float)  # Energy of the emitted gamma
+        self.Width  = np.asarray(_Width,dtype=float)   # Width Gamma_r of the resonant level
+        self.prob   = np.asarray(_prob,dtype=float)    # Branching ratio brj of decay from resonance to final state
+        self.GSprob = np.asarray(_GSprob,dtype=float)  # Branching ratio b0r of decay from resonance to ground sate
+        self.J0     = np.asarray(_J0,dtype=float)
+        self.Jr     = np.asarray(_Jr,dtype=float)
+        self.TDebye = np.asarray(_TDebye,dtype=float)
+        self.nDens  = np.asarray(_nDens,dtype=float).reshape(-1,2)         # atom / cm^2 * 1e-24 [Warhead,Foil]
+        self.thickness = np.asarray(_thickness,dtype=float).reshape(-1,2)  # [Warhead,Foil] thickness
+        self.flux   = np.ones(len(self.Elevel)) * _flux  # Source photons per MeV at Elevel, see NRFSource
+        self.index  = np.arange(len(self.Elevel))
+
+        # The Doppler-broadened peak height doesn't depend on the layers, so it is only worked out once
+        g = (2.0*self.Jr+1)/(2.0*(2.0*self.J0+1))
+        Mc2 = self.a * amu # MeV
+        self.Delta = self.Elevel * np.sqrt(2*kB*effective_temperature(self.TDebye,300.0)/Mc2)
+        self.sigmaDmax = 1.0e28 * 2.0 * (np.pi)**(3.0/2.0) * g * (hbarc/self.Elevel)**2 * self.prob * self.GSprob * self.Width / self.Delta # b
+
+        self.update(_sigmaNRLevel,_sigmaNRGamma)
+
+    # Single vectorized pass over the density-dependent columns, line-for-line the same arithmetic as NRFGamma
+    def update(self, _sigmaNRLevel, _sigmaNRGamma):
+        # Calculate the energy-integrated cross section
+        g = (2.0*self.Jr+1)/(2.0*(2.0*self.J0+1))
+        sigmaInt = 1.0e34 * 2.0 * (np.pi)**2 * g * (hbarc/self.Elevel)**2 * self.Width * self.prob * self.GSprob # eV b
+        self.sigmaInt = (sigmaInt/self.prob)[:,None] * self.nDens
+
+        # Calculate the alpha factor : mu_NRF(Elevel) + mu_NR(Elevel) + 2*mu_NR(Egamma) [Warhead,Foil]
+        self.sigmaNRLevel = np.asarray(_sigmaNRLevel,dtype=float).reshape(-1,2) * self.Delta[:,None] * self.nDens
+        self.sigmaNRGamma = np.asarray(_sigmaNRGamma,dtype=float).reshape(-1,2) * self.Delta[:,None] * self.nDens
+        self.alpha = np.column_stack((self.sigmaInt[:,0] + self.sigmaNRLevel[:,0] , self.sigmaInt[:,1] + self.sigmaNRLevel[:,1] + 2*self.sigmaNRGamma[:,1]))
+
+        self.counts = self.flux * np.exp(-self.alpha[:,0]*self.thickness[:,0]) * self.prob * self.sigmaInt[:,1] / self.alpha[:,1] * (1 - np.exp(-self.alpha[:,1]*self.thickness[:,1]))
+
+    # New table for the same lines with other [warhead,foil] number densities and thicknesses
+    # Only the density-dependent columns are recomputed, the rest are shared with this table
+    def rescaled(self, _nDens, _thickness, _sigmaNRLevel, _sigmaNRGamma):
+        table = copy.copy(self)
+        table.nDens = np.asarray(_nDens,dtype=float).reshape(-1,2)
+        table.thickness = np.asarray(_thickness,dtype=float).reshape(-1,2)
+        table.update(_sigmaNRLevel,_sigmaNRGamma)
+        return table
+
+    def __len__(self):
+        return len(self.Elevel)
+
+    def __getitem__(self, i):
+        if i < 0: i += len(self)
+        if i < 0 or i >= len(self): raise IndexError('NRFLineTable index out of range')
+        return NRFLineView(self,i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield NRFLineView(self,i)
+
+    # Bytes held by the table's arrays
+    def nbytes(self):
+        return sum(getattr(self,field).nbytes for field in self.scalarFields + self.layerFields + ('index',))
+
+# Read-only view of one row of an NRFLineTable, with the same attributes as an NRFGamma instance
+class NRFLineView(object):
+    __slots__ = ('_table','index')
+
+    def __init__(self, table, i):
+        object.__setattr__(self,'_table',table)
+        object.__setattr__(self,'index',i)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('NRFLineView is read-only, update the NRFLineTable instead')
+
+    def __repr__(self):
+        return 'NRFLineView(index=%i, z=%i, a=%i, Elevel=%s, Egamma=%s)' % (self.index, self.z, self.a, self.Elevel, self.Egamma)
+
+def _scalar_property(field):
+    return property(lambda self: getattr(self._table,field)[self.index])
+
+def _layer_property(field):
+    return property(lambda self: tuple(getattr(self._table,field)[self.index]))
+
+for _field in NRFLineTable.scalarFields:
+    setattr(NRFLineView,_field,_scalar_property(_field))
+for _field in NRFLineTable.layerFields:
+    setattr(NRFLineView,_field,_layer_property(_field))
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Importable pipeline for the 1D NRF Parameter Uncertainty Calculator - Python 2.7
+
+# The databases are loaded once when the pipeline is built and stay resident, as do the parsed material lists
+# and their mixture attenuation curves, so repeated scans in one process only redo the filtering and ranking
+# Example:
+#    pipeline = NRFPipeline()
+#    result = pipeline.run('matList.txt',EMin=1,EMax=2.5,bremsMin=2,bremsMax=9,neighE=0.01,numBranch=5,numNeigh=5)
+#    result.neighPairs, result.neighCounts, result.table('neigh')
+# Pass instrument=NRFInstrument.NRFInstrument() to record the time spent in each stage, see pipeline.instrument.report()
+
+import os
+import numpy as np
+
+import NRFmultiLine
+import NRFDatabase
+import NRFStream
+import NRFUncertainty
+import NRFProfile
+import NRFInstrument
+import NRFIncremental
+
+# ------ ------ ------
+
+# Function to check the energy windows and neighbour gap of a scan, raising ValueError for any that makes no sense
+# Parameters left as None are not checked, so rank can check the neighbour gap alone
+def check_scan_params(EMin=None,EMax=None,bremsMin=None,bremsMax=None,neighE=None):
+    if EMax != None and (EMax<=EMin or EMax<=0): raise ValueError("Maximum detector energy must be greater than minimum detector energy and positive")
+    if bremsMax != None and (bremsMax<=bremsMin or bremsMax<=0): raise ValueError("Maximum Bremsstrahlung energy must be greater than minimum Bremsstrahlung enery and positive")
+    # Check that definition of 'neighbour' is positive
+    if neighE != None and neighE <= 0: raise ValueError("Neighbour energy gap must be > 0")
+
+# ------ ------ ------
+
+# Isotopes of a material file, their [warhead,foil] number densities and thicknesses, and the mixture attenuation lookup
+class NRFMaterials(object):
+    def __init__(self, _matList, _nDensList, _thickList, _NRMixture):
+        self.matList   = _matList
+        self.nDensList = _nDensList
+        self.thickList = _thickList
+        self.NRMixture = _NRMixture
+
+# Outcome of one scan. Pairs are (nPairs,2) arrays of emitList indexes, ranked by the minimum counts of the pair, largest first
+# nBranch / nNeigh are the total numbers of pairs found, before keeping only the top ones
+class NRFScanResult(object):
+    def __init__(self, _params, _emitList, _sourceStrength, _branchPairs, _branchCounts, _nBranch, _neighPairs, _neighCounts, _nNeigh):
+        self.params         = _params
+        self.emitList       = _emitList
+        self.sourceStrength = _sourceStrength
+        self.branchPairs    = _branchPairs
+        self.branchCounts   = _branchCounts
+        self.nBranch        = _nBranch
+        self.neighPairs     = _neighPairs
+        self.neighCounts    = _neighCounts
+        self.nNeigh         = _nNeigh
+
+    # Table of the ranked pairs of one kind, 'branch' or 'neigh', one row per pair
+    def table(self, kind):
+        if kind == 'branch': return NRFmultiLine.pair_table(self.emitList,self.branchPairs,self.branchCounts)
+        return NRFmultiLine.pair_table(self.emitList,self.neighPairs,self.neighCounts)
+
+    # Printed report of the top numBranch branched and numNeigh neighbouring pairs (a kind is skipped if None)
+    def report(self, numBranch, numNeigh):
+        report = []
+        if numBranch != None: report.append(NRFmultiLine.format_pairs(self.table('branch'),'branch',numBranch,self.nBranch))
+        if numNeigh != None: report.append(NRFmultiLine.format_pairs(self.table('neigh'),'neigh',numNeigh,self.nNeigh))
+        return ''.join(report)
+
+# Outcome of a streaming scan, which keeps the tables of its top pairs rather than the full line table
+class NRFStreamResult(NRFScanResult):
+    def __init__(self, _params, _sourceStrength, _branchTable, _nBranch, _neighTable, _nNeigh):
+        NRFScanResult.__init__(self,_params,None,_sourceStrength,
+                               np.column_stack((_branchTable['index1'],_branchTable['index2'])),_branchTable['minCounts'],_nBranch,
+                               np.column_stack((_neighTable['index1'],_neighTable['index2'])),_neighTable['minCounts'],_nNeigh)
+        self.tables = {'branch':_branchTable, 'neigh':_neighTable}
+
+    def table(self, kind):
+        return self.tables[kind]
+
+# ------ ------ ------
+
+class NRFPipeline(object):
+    def __init__(self, databaseFile='standalone.dat', NRFile='nonResonantAttenuation.txt', cacheDir=None, useCache=True, instrument=None):
+        self.databaseFile = databaseFile
+        self.cacheDir = cacheDir
+        self.useCache = useCache
+        self.instrument = instrument if instrument is not None else NRFInstrument.disabled
+        with self.instrument.stage('nr_load') as stage:
+            self.NREnergy, self.NRData = NRFDatabase.load_nonresonant(NRFile,cacheDir,useCache)
+            stage.items = len(self.NREnergy)
+        self._NRFData = None
+        self._index = None
+        self._materials = {}
+
+    # The line database is loaded on first use, so a pipeline used only for streaming scans never holds it
+    # databaseFile can be standalone.dat or the Mathematica CSV export (any .csv file)
+    @property
+    def NRFData(self):
+        if self._NRFData is None:
+            with self.instrument.stage('database_load') as stage:
+                self._NRFData = NRFDatabase.load_database(self.databaseFile,self.cacheDir,self.useCache)
+                stage.items = len(self._NRFData)
+        return self._NRFData
+
+    # Isotope index of the line database, built on first use
+    @property
+    def index(self):
+        if self._index is None:
+            with self.instrument.stage('database_index',len(self.NRFData)):
+                self._index = NRFDatabase.NRFLineIndex(self.NRFData)
+        return self._index
+
+    # The database lines a scan of matList has to look at
+    # The Mathematica export is read through the isotope index, so only the listed isotopes' blocks are filtered
+    def lines_for(self, matList):
+        if NRFDatabase.is_mathematica(self.databaseFile): return self.index.select(matList)
+        return self.NRFData
+
+    # Parse a material file, reusing the earlier result while the file is unchanged
+    def load_materials(self, matFile):
+        if isinstance(matFile,NRFMaterials): return matFile
+        key = (os.path.abspath(matFile),os.path.getmtime(matFile))
+        if key not in self._materials:
+            with self.instrument.stage('material_parse') as stage:
+                matList, nDensList, thickList = NRFmultiLine.parse_materials(matFile)
+                stage.items = len(matList)
+            self._materials[key] = self.materials(matList,nDensList,thickList)
+        return self._materials[key]
+
+    # Build materials directly from lists, for callers that don't keep them in a file
+    def materials(self, matList, nDensList, thickList):
+        # Error checking on material lists (though this will normally be caught during reading)
+        if len(matList) != len(nDensList): raise ValueError("Material input incorrect: different numbers of isotopes and number densities in file")
+        if len(matList) == 0 : raise ValueError("Material input incorrect: must contain at least one material")
+        with self.instrument.stage('materials',len(matList)):
+            NRMixture = NRFmultiLine.NRLookup(self.NREnergy,NRFmultiLine.mixture_attenuation(self.NRData,matList,nDensList))
+        return NRFMaterials(matList,nDensList,thickList,NRMixture)
+
+    # Select the lines in the energy windows and build their table, with counts normalized to the source strength
+    def scan(self, matFile, EMin=0, EMax=20, bremsMin=0, bremsMax=20):
+        # Check that energy ranges make sense
+        check_scan_params(EMin,EMax,bremsMin,bremsMax)
+        materials = self.load_materials(matFile)
+
+        emitList = NRFmultiLine.build_lines(self.lines_for(materials.matList),materials.matList,materials.nDensList,materials.thickList,materials.NRMixture,EMin,EMax,bremsMin,bremsMax,self.instrument)
+        with self.instrument.stage('source_strength',len(emitList)):
+            sourceStrength = NRFmultiLine.source_strength(emitList,materials.matList) if len(emitList) > 0 else 1.0
+            emitList.counts = emitList.counts*sourceStrength
+        return emitList, sourceStrength
+
+    # Rank the branched and neighbouring pairs of a line table, keeping numBranch / numNeigh of each (all if None)
+    def rank(self, emitList, neighE=0.001, numBranch=None, numNeigh=None):
+        check_scan_params(neighE=neighE)
+        with self.instrument.stage('rank_pairs') as stage:
+            ranked = NRFmultiLine.rank_pairs(emitList,neighE,numBranch,numNeigh)
+            stage.items = ranked[0][2] + ranked[1][2]
+        self.instrument.count('branched_pairs',ranked[0][2])
+        self.instrument.count('neighbouring_pairs',ranked[1][2])
+        return ranked
+
+    # Rank the pairs of an already scanned line table and wrap them up as a result
+    def rank_result(self, emitList, sourceStrength, neighE=0.001, numBranch=None, numNeigh=None, params=None):
+        (branchPairs, branchCounts, nBranch), (neighPairs, neighCounts, nNeigh) = self.rank(emitList,neighE,numBranch,numNeigh)
+        return NRFScanResult(params,emitList,sourceStrength,branchPairs,branchCounts,nBranch,neighPairs,neighCounts,nNeigh)
+
+    def run(self, matFile, EMin=0, EMax=20, bremsMin=0, bremsMax=20, neighE=0.001, numBranch=None, numNeigh=None):
+        params = {'EMin':EMin, 'EMax':EMax, 'bremsMin':bremsMin, 'bremsMax':bremsMax, 'neighE':neighE}
+        emitList, sourceStrength = self.scan(matFile,EMin,EMax,bremsMin,bremsMax)
+        return self.rank_result(emitList,sourceStrength,neighE,numBranch,numNeigh,params)
+
+    # Monte Carlo confidence intervals for the ranked pairs of one kind of a result, see NRFUncertainty.pair_uncertainty
+    def uncertainty(self, result, kind, nSamples=10000, seed=None, relUnc=None, confidence=0.68):
+        if result.emitList is None: raise ValueError("Monte Carlo uncertainties need the line table, which streaming scans don't keep")
+        pairs = result.branchPairs if kind == 'branch' else result.neighPairs
+        with self.instrument.stage('uncertainty',nSamples*len(pairs)):
+            return NRFUncertainty.pair_uncertainty(result.emitList,pairs,nSamples,seed,relUnc,confidence)
+
+    # Work out everything about a scan that doesn't depend on the number densities or thicknesses, so that it can be
+    # rerun for new ones in a few vector operations, see NRFIncremental.NRFIncrementalScan.evaluate
+    def prepare(self, matFile, EMin=0, EMax=20, bremsMin=0, bremsMax=20, neighE=0.001):
+        check_scan_params(EMin,EMax,bremsMin,bremsMax,neighE)
+        return NRFIncremental.NRFIncrementalScan(self,self.load_materials(matFile),EMin,EMax,bremsMin,bremsMax,neighE)
+
+    # Same as run, but reads the line database chunkLines rows at a time instead of loading it whole
+    # For databases too large for memory. The result holds the tables of the top pairs but no line table
+    def stream(self, matFile, EMin=0, EMax=20, bremsMin=0, bremsMax=20, neighE=0.001, numBranch=None, numNeigh=None, chunkLines=1<<16):
+        check_scan_params(EMin,EMax,bremsMin,bremsMax,neighE)
+        if NRFDatabase.is_mathematica(self.databaseFile): raise ValueError("Streaming scans read standalone.dat format only, not the Mathematica export")
+        params = {'EMin':EMin, 'EMax':EMax, 'bremsMin':bremsMin, 'bremsMax':bremsMax, 'neighE':neighE}
+        sourceStrength, ((branchTable, nBranch), (neighTable, nNeigh)) = NRFStream.stream_scan(self.databaseFile,self.load_materials(matFile),
+                                                                                               EMin,EMax,bremsMin,bremsMax,neighE,numBranch,numNeigh,chunkLines,
+                                                                                               instrument=self.instrument)
+        return NRFStreamResult(params,sourceStrength,branchTable,nBranch,neighTable,nNeigh)
+
+    # Doppler-broadened transmission [warhead,foil] of a scanned line table's materials on an energy grid
+    # The grid defaults to one covering every resonance (see NRFProfile.resonance_grid)
+    # Returns the grid, the (grid,2) transmission and the energy-integrated transmission of each layer
+    def transmission(self, emitList, matFile, grid=None, shape='gauss', nWidths=5.0):
+        materials = self.load_materials(matFile)
+        if grid is None: grid = NRFProfile.resonance_grid(emitList,nWidths)
+        # Non-resonant optical depth of each layer, from every isotope's density times its thickness
+        NRDepth = NRFmultiLine.NRLookup(self.NREnergy,NRFmultiLine.mixture_attenuation(self.NRData,materials.matList,
+                                        np.asarray(materials.nDensList,dtype=float)*np.asarray(materials.thickList,dtype=float)))(grid)
+        integrated, absorbed, T = NRFProfile.integrated_transmission(emitList,grid,NRDepth,shape,nWidths)
+        return grid, T, integrated
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Plots of branched and neighbouring NRF line pairs - Python 2.7
+
+# Draws the 2x2 panels of each kind of pair from the series returned by NRFmultiLine.pair_series
+# matplotlib is only imported when something is drawn, with the non-interactive Agg backend unless the plots are
+# to be shown on screen, so batch jobs never need a display. Each series is drawn with one call per panel and
+# very large sets of pairs are thinned to at most maxPoints points first
+# Example:
+#    branchSeries, neighSeries = NRFmultiLine.pair_series(emitList,0.01)
+#    NRFPlot.render_pairs(branchSeries,neighSeries,'scan1')    # writes scan1_branch.png and scan1_neigh.png
+
+import sys
+import multiprocessing
+import numpy as np
+
+# Default largest number of points drawn per series
+maxPlotPoints = 20000
+
+# Panels of each kind of pair: (x series, y series, x label, y label), y always on a log scale
+# Ratio panels also get a dashed line at 1
+panels = {'branch':[('energy','alpha','Resonance energy (MeV)','$\\alpha_{0,1}$ (b)'),
+                    ('energy','ratio','Resonance energy (MeV)','$\\frac{\\alpha_{0,1}}{\\alpha_{0,2}}$'),
+                    ('sigma','ratio','Min B$*\\sigma_{NRF}$ (b)','$\\frac{\\alpha_{0,1}}{\\alpha_{0,2}}$'),
+                    ('counts','ratio','Min counts','$\\frac{\\alpha_{0,1}}{\\alpha_{0,2}}$')],
+          'neigh':[('energy','alpha','Resonance Energy (MeV)','Min$(\\alpha_{0,1},\\alpha_{2,3})$'),
+                   ('energy','ratio','Resonance Energy (MeV)','$\\frac{\\alpha_{0,1}}{\\alpha_{2,3}}$'),
+                   ('sigma','ratio','Median $\\sigma_{NRF}$ (b)','$\\frac{\\alpha_{0,1}}{\\alpha_{2,3}}$'),
+                   ('counts','ratio','Min counts','$\\frac{\\alpha_{0,1}}{\\alpha_{2,3}}$')]}
+titles = {'branch':'Branched emissions', 'neigh':'Neighbouring emissions'}
+emptyTitles = {'branch':'No branched pairs', 'neigh':'No neighbouring pairs'}
+
+# ------ ------ ------
+
+# Import pyplot on first use. Unless interactive, select the Agg backend first so no display is needed
+def _pyplot(interactive=False):
+    if 'matplotlib.pyplot' not in sys.modules and not interactive:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+# Positions of at most maxPoints of n pairs, spread evenly through them, always keeping the pair with the most counts
+def thin(series,maxPoints=maxPlotPoints):
+    n = len(series['counts'])
+    if maxPoints == None or n <= maxPoints: return np.arange(n)
+    keep = np.unique(np.linspace(0,n-1,maxPoints).astype(int))
+    return np.union1d(keep,[np.argmax(series['counts'])])
+
+# Function to draw the 2x2 panels of one kind of pair ('branch' or 'neigh') on a matplotlib figure
+def draw_pairs(figure,series,kind,maxPoints=maxPlotPoints):
+    figure.clf()
+    if len(series['counts']) == 0:
+        figure.suptitle(emptyTitles[kind],fontsize=24)
+        return figure
+    figure.suptitle(titles[kind],fontsize=18)
+    shown = thin(series,maxPoints)
+    for i, (xName, yName, xLabel, yLabel) in enumerate(panels[kind]):
+        axes = figure.add_subplot(2,2,i+1)
+        axes.semilogy(series[xName][shown],series[yName][shown],'.k',rasterized=len(shown) > 1000)
+        if yName == 'ratio': axes.semilogy([0,np.max(series[xName])],[1,1],'--r')
+        axes.tick_params(axis='both',which='major',labelsize=14)
+        axes.set_xlabel(xLabel,fontsize=18)
+        axes.set_ylabel(yLabel,fontsize=40 if yName == 'ratio' else (24 if kind == 'branch' else 18))
+    return figure
+
+# Function to write the branched and neighbouring panels to <prefix>_branch.<fileType> and <prefix>_neigh.<fileType>
+# Returns the names of the files written
+def render_pairs(branchSeries,neighSeries,prefix,fileType='png',maxPoints=maxPlotPoints,size=(16,12),dpi=100):
+    plt = _pyplot()
+    fileNames = []
+    for kind, series in (('branch',branchSeries),('neigh',neighSeries)):
+        figure = plt.figure(figsize=size)
+        try:
+            draw_pairs(figure,series,kind,maxPoints)
+            fileNames.append('%s_%s.%s' % (prefix,kind,fileType))
+            figure.savefig(fileNames[-1],dpi=dpi)
+        finally:
+            plt.close(figure)
+    return fileNames
+
+# Function to draw both kinds of pair on screen, as -plotOn=1 does
+def show_pairs(branchSeries,neighSeries,maxPoints=maxPlotPoints):
+    plt = _pyplot(interactive=True)
+    draw_pairs(plt.figure(1),branchSeries,'branch',maxPoints)
+    draw_pairs(plt.figure(2),neighSeries,'neigh',maxPoints)
+    plt.show()
+
+# ------ ------ ------
+
+# Function to render a batch of scans to files across a pool of processes
+# jobs is a list of (branchSeries, neighSeries, prefix). Returns the list of file names written for each job
+def render_batch(jobs,processes=None,fileType='png',maxPoints=maxPlotPoints):
+    jobs = [(branchSeries,neighSeries,prefix,fileType,maxPoints) for branchSeries, neighSeries, prefix in jobs]
+    if processes == 1 or len(jobs) <= 1:
+        return [_render_job(job) for job in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_render_job,jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+def _render_job(job):
+    return render_pairs(*job)
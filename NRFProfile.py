@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Doppler-broadened NRF cross section profiles - Python 2.7
+
+# Each resonant level absorbs with a Doppler-broadened profile of 1/e half width Delta, set by the effective
+# temperature of the absorber's lattice (Lamb's Debye model), and natural width Width:
+#    gauss : sigma(E) = sigmaDmax/prob * exp(-((E-Elevel)/Delta)^2)
+#    voigt : sigma(E) = sigmaDmax/prob * Re[w((E-Elevel + i*Width/2)/Delta)], w the Faddeeva function
+# Both integrate to the level's energy-integrated cross section. Branches of a level share its absorption, so
+# profiles are evaluated once per (z, a, Elevel)
+# Every level only touches the grid points within nWidths of its centre, so profiles are summed onto the grid
+# through (level, grid point) windows, a block at a time, and the dense levels x grid matrix is never built
+
+import numpy as np
+from numpy.polynomial.legendre import leggauss
+from scipy.special import wofz
+
+# Gauss-Legendre nodes and weights on [0,1] for the Debye integral
+_nodes, _weights = leggauss(32)
+_nodes, _weights = 0.5*(_nodes+1), 0.5*_weights
+
+# ------ ------ ------
+
+# Function to find the effective temperature (K) of nuclei in a Debye solid at temperature T (K), after Lamb
+#    Teff = 3T (T/TDebye)^3 Int_0^(TDebye/T) t^3 (1/(e^t-1) + 1/2) dt
+# Lines with no Debye temperature (TDebye <= 0) are treated as a free gas, Teff = T
+def effective_temperature(TDebye,T=300.0):
+    TDebye = np.asarray(TDebye,dtype=float)
+    x = np.where(TDebye > 0,TDebye,0.0)[...,None] / T
+    # Substituting t = x*u keeps the integral on [0,1]: Teff = 3T x Int_0^1 u^3 (1/(e^(xu)-1) + 1/2) du
+    with np.errstate(divide='ignore',invalid='ignore'):
+        integrand = _nodes**3 * (1.0/np.expm1(x*_nodes) + 0.5)
+        Teff = 3*T * x[...,0] * np.sum(integrand*_weights,axis=-1)
+    return np.where(TDebye > 0,Teff,T)
+
+# ------ ------ ------
+
+# The resonant levels of a line table, one row per (z, a, Elevel), with the peak absorption cross section of the level
+# Returns a dict of arrays: Elevel, Delta, Width, peak (b), nDens and thickness ([warhead,foil] per level)
+def levels(emitList):
+    order = np.lexsort((emitList.Elevel,emitList.a,emitList.z))
+    first = np.ones(len(order),dtype=bool)
+    first[1:] = (np.diff(emitList.z[order]) != 0) | (np.diff(emitList.a[order]) != 0) | (np.diff(emitList.Elevel[order]) != 0)
+    rows = order[first]
+    return {'Elevel':emitList.Elevel[rows], 'Delta':emitList.Delta[rows], 'Width':emitList.Width[rows],
+            'peak':emitList.sigmaDmax[rows]/emitList.prob[rows],
+            'nDens':emitList.nDens[rows], 'thickness':emitList.thickness[rows]}
+
+# Function to build a shared energy grid (MeV) covering every level out to nWidths Doppler widths,
+# with pointsPerWidth points per Delta, merged into one sorted grid
+def resonance_grid(emitList,nWidths=5.0,pointsPerWidth=8):
+    level = levels(emitList)
+    nPoints = int(2*nWidths*pointsPerWidth) + 1
+    offsets = np.linspace(-nWidths,nWidths,nPoints)
+    return np.unique((level['Elevel'][:,None] + offsets*level['Delta'][:,None]).ravel())
+
+# Function to sum the level cross sections (b) onto a sorted energy grid (MeV)
+# weights (nLevels,) or (nLevels,k) scale each level, e.g. by its number density, giving a (grid,) or (grid,k) result
+# Each level is evaluated only within nWidths of max(Delta, Width) of its centre, blockPoints (level, point) pairs at a time
+def cross_section(level,grid,weights=None,shape='gauss',nWidths=5.0,blockPoints=1<<20):
+    grid = np.asarray(grid,dtype=float)
+    if weights is None: weights = np.ones(len(level['Elevel']))
+    weights = np.asarray(weights,dtype=float)
+    total = np.zeros((len(grid),) + weights.shape[1:])
+    if shape not in ('gauss','voigt'):
+        raise ValueError("Profile shape must be 'gauss' or 'voigt'")
+
+    halfWidth = nWidths*np.maximum(level['Delta'],level['Width'])
+    lower = np.searchsorted(grid,level['Elevel']-halfWidth,side='left')
+    upper = np.searchsorted(grid,level['Elevel']+halfWidth,side='right')
+    for levelIdx, gridIdx in _window_blocks(lower,upper,blockPoints):
+        x = (grid[gridIdx] - level['Elevel'][levelIdx]) / level['Delta'][levelIdx]
+        if shape == 'gauss':
+            profile = np.exp(-x**2)
+        else:
+            profile = wofz(x + 0.5j*level['Width'][levelIdx]/level['Delta'][levelIdx]).real
+        values = (level['peak'][levelIdx]*profile).reshape((-1,) + (1,)*(weights.ndim-1)) * weights[levelIdx]
+        if weights.ndim == 1:
+            total += np.bincount(gridIdx,weights=values,minlength=len(grid))
+        else:
+            for k in range(weights.shape[1]):
+                total[:,k] += np.bincount(gridIdx,weights=values[:,k],minlength=len(grid))
+    return total
+
+# Generator over the (level, grid point) pairs of windows [lower, upper), in blocks of about blockPoints pairs
+def _window_blocks(lower,upper,blockPoints):
+    counts = upper - lower
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        stop = max(start+1,np.searchsorted(ends,(ends[start-1] if start > 0 else 0) + blockPoints,side='right'))
+        blockCounts = counts[start:stop]
+        levelIdx = np.repeat(np.arange(start,stop),blockCounts)
+        # Position of each pair inside its own window, added to the window's first grid point
+        firstPair = np.cumsum(blockCounts) - blockCounts
+        gridIdx = np.arange(len(levelIdx)) - np.repeat(firstPair,blockCounts) + np.repeat(lower[start:stop],blockCounts)
+        yield levelIdx, gridIdx
+        start = stop
+
+# ------ ------ ------
+
+# Function to find the transmission [warhead,foil] of the layers at each grid energy
+# Resonant optical depth of each level is nDens * thickness * sigma(E). NRDepth, if given, is the (grid,2)
+# non-resonant optical depth of the layers, e.g. from NRFmultiLine.mixture_attenuation weighted by thickness
+def transmission(emitList,grid,NRDepth=None,shape='gauss',nWidths=5.0):
+    level = levels(emitList)
+    depth = cross_section(level,grid,level['nDens']*level['thickness'],shape,nWidths)
+    if NRDepth is not None: depth = depth + NRDepth
+    return np.exp(-depth)
+
+# Function to integrate the transmission [warhead,foil] over the grid (MeV), by the trapezium rule
+# Returns the integrated transmission, the integrated absorption (the grid's width minus the transmission)
+# and the (grid,2) transmission that was integrated, so callers wanting the curve too only evaluate the profiles once
+def integrated_transmission(emitList,grid,NRDepth=None,shape='gauss',nWidths=5.0):
+    T = transmission(emitList,grid,NRDepth,shape,nWidths)
+    integrated = np.trapz(T,grid,axis=0)
+    return integrated, (grid[-1]-grid[0]) - integrated, T
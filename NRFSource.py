@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Bremsstrahlung photon source spectra - Python 2.7
+
+# The source is a thick-target bremsstrahlung spectrum from Kramers' law, dN/dE ~ (E0 - E)/E up to the endpoint E0 = bremsMax,
+# cut off below bremsMin. It is binned once per (bremsMin, bremsMax, nBins) and normalized to one photon in total
+# Binned spectra are kept in _spectra, so repeated scans with the same source never recompute them
+
+import numpy as np
+
+# Default number of energy bins between bremsMin and bremsMax
+spectrumBins = 1000
+
+# Cache of binned spectra, keyed on (bremsMin, bremsMax, nBins)
+_spectra = {}
+
+# ------ ------ ------
+
+# Binned spectrum with a vectorized lookup of the photon flux (photons / MeV) at any energies
+class BremsSpectrum(object):
+    def __init__(self, _edges, _flux):
+        self.edges = _edges  # Bin edges (MeV)
+        self.flux  = _flux   # Mean flux in each bin (photons / MeV)
+
+    def __call__(self, E):
+        E = np.asarray(E,dtype=float)
+        bins = np.searchsorted(self.edges,E,side='right') - 1
+        inside = (bins >= 0) & (bins < len(self.flux))
+        return np.where(inside,self.flux[np.clip(bins,0,len(self.flux)-1)],0.0)
+
+# Function to return the binned spectrum for a source, building it on first use
+def brems_spectrum(bremsMin,bremsMax,nBins=spectrumBins):
+    key = (float(bremsMin),float(bremsMax),int(nBins))
+    if key not in _spectra:
+        edges = np.linspace(bremsMin,bremsMax,nBins+1)
+        _spectra[key] = BremsSpectrum(edges,_kramers_bins(edges,bremsMax))
+    return _spectra[key]
+
+# Mean of (E0/E - 1) over each bin, from its exact integral E0*log(E2/E1) - (E2-E1), normalized to unit total
+# A bin starting at 0 MeV would diverge, so it takes the value at its centre instead
+def _kramers_bins(edges,E0):
+    lower, upper = edges[:-1], edges[1:]
+    width = upper - lower
+    with np.errstate(divide='ignore',invalid='ignore'):
+        flux = np.where(lower > 0, (E0*np.log(upper/lower) - width)/width, E0/(0.5*(lower+upper)) - 1)
+    flux = np.maximum(flux,0.0)
+    total = np.sum(flux*width)
+    return flux/total if total > 0 else flux
+
+# Function to empty the spectrum cache
+def clear_cache():
+    _spectra.clear()
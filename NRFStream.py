@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Streaming scan for NRF databases too large to hold in memory - Python 2.7
+
+# standalone.dat is read a chunk of rows at a time. Each chunk is filtered, its lines are built and sorted by Elevel,
+# and the sorted run is spilled to a memory-mapped temporary file. The runs are then merged back in Elevel order a
+# block at a time, and pairs are found with a carry-over window holding only the lines within -neighE of the newest
+# ones, so branched and neighbouring pairs that straddle chunk boundaries are still found. Only the best pairs are kept
+# Peak memory is set by the chunk and block sizes and the number of pairs kept, not by the size of the database
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+import NRFmultiLine
+import NRFDatabase
+import NRFInstrument
+
+# The per-line fields a streaming scan needs to rank and report pairs
+lineDtype = np.dtype([('index',np.int64),('z',np.int32),('a',np.int32),('Elevel',float),('Egamma',float),('prob',float),
+                      ('alpha',float,(2,)),('counts',float)])
+
+# ------ ------ ------
+
+# Function to run a scan over a database file in chunks
+# materials is an NRFMaterials instance (see NRFPipeline.load_materials)
+# Returns the sourceStrength and [branchTable, nBranch], [neighTable, nNeigh] with the top pairs as pair tables
+# instrument times each chunk's filtering and table construction and the merge and ranking of the runs
+def stream_scan(databaseFile,materials,EMin,EMax,bremsMin,bremsMax,neighE,numBranch=None,numNeigh=None,chunkLines=1<<16,blockLines=1<<14,tempDir=None,
+                instrument=NRFInstrument.disabled):
+    maxLineCount = np.zeros(len(materials.matList))
+    ranker = StreamingPairRanker(neighE,numBranch,numNeigh)
+    runDir = tempfile.mkdtemp(prefix='nrfstream',dir=tempDir)
+    try:
+        # Filter each chunk, build its lines and spill them sorted by Elevel
+        # All runs go one after another into a single spill file, so only one file is ever mapped
+        runBounds = [0]
+        spillName = os.path.join(runDir,'runs.bin')
+        with open(spillName,'wb') as spillFile:
+            for chunk in NRFDatabase.iter_standalone(databaseFile,chunkLines):
+                emitList = NRFmultiLine.build_lines(chunk,materials.matList,materials.nDensList,materials.thickList,materials.NRMixture,EMin,EMax,bremsMin,bremsMax,instrument)
+                instrument.count('chunks')
+                if len(emitList) == 0: continue
+                # Track the largest line of each isotope for the source normalization
+                maxLineCount = np.maximum(maxLineCount,NRFmultiLine.isotope_max_counts(emitList.z,emitList.a,emitList.counts,materials.matList))
+
+                lines = line_records(emitList,runBounds[-1])
+                lines[np.argsort(lines['Elevel'],kind='mergesort')].tofile(spillFile)
+                runBounds.append(runBounds[-1] + len(lines))
+
+        # Merge the runs back in Elevel order and rank the pairs as the lines stream past
+        if runBounds[-1] > 0:
+            with instrument.stage('merge_rank',runBounds[-1]):
+                spill = np.memmap(spillName,dtype=lineDtype,mode='r')
+                for block in merge_runs([spill[start:stop] for start, stop in zip(runBounds[:-1],runBounds[1:])],blockLines):
+                    ranker.add(block)
+                del spill
+    finally:
+        shutil.rmtree(runDir,ignore_errors=True)
+
+    # Set the source strength from the isotope max lines, as the in-memory scan does
+    # Ranking on the unscaled counts gives the same order, so only the kept pairs need rescaling
+    sourceStrength = NRFmultiLine.strength_from_max(maxLineCount)
+    return sourceStrength, ranker.finish(sourceStrength)
+
+# Function to copy the fields a streaming scan needs out of a line table, numbering the lines from firstIndex
+def line_records(emitList,firstIndex=0):
+    lines = np.zeros(len(emitList),dtype=lineDtype)
+    for field in lineDtype.names:
+        lines[field] = getattr(emitList,field)
+    lines['index'] += firstIndex
+    return lines
+
+# Generator merging runs of lines each sorted by Elevel into blocks of at most about blockLines lines, in Elevel order overall
+def merge_runs(runs,blockLines):
+    position = [0]*len(runs)
+    while True:
+        live = [i for i in range(len(runs)) if position[i] < len(runs[i])]
+        if len(live) == 0: return
+        # Everything up to the smallest last Elevel of the runs' next slices is safe to emit
+        sliceLines = max(1,blockLines//len(live))
+        slices = dict((i,runs[i][position[i]:position[i]+sliceLines]) for i in live)
+        limit = min(slices[i]['Elevel'][-1] for i in live)
+        parts = []
+        for i in live:
+            n = np.searchsorted(slices[i]['Elevel'],limit,side='right')
+            parts.append(np.array(slices[i][:n]))
+            position[i] += n
+        block = np.concatenate(parts)
+        yield block[np.argsort(block['Elevel'],kind='mergesort')]
+
+# ------ ------ ------
+
+# Ranks the pairs of lines arriving in blocks of nondecreasing Elevel, keeping the top numBranch / numNeigh of each kind
+# Lines of earlier blocks within deltaNeigh of the newest line are carried over so pairs across blocks are found
+class StreamingPairRanker(object):
+    def __init__(self, deltaNeigh, numBranch=None, numNeigh=None, blockSize=1<<16):
+        self.deltaNeigh = deltaNeigh
+        self.numOut = {'branch':numBranch, 'neigh':numNeigh}
+        self.blockSize = blockSize
+        self.carry = np.zeros(0,dtype=lineDtype)
+        self.best = {'branch':np.zeros(0,dtype=NRFmultiLine.pairDtype), 'neigh':np.zeros(0,dtype=NRFmultiLine.pairDtype)}
+        self.total = {'branch':0, 'neigh':0}
+
+    def add(self, block):
+        if len(block) == 0: return
+        if len(self.carry) > 0 and block['Elevel'][0] < self.carry['Elevel'][-1]:
+            raise ValueError('StreamingPairRanker ERROR: \nLines must arrive in nondecreasing Elevel order')
+        lines = np.concatenate((self.carry,block))
+        nCarry = len(self.carry)
+
+        for kind, pairs in NRFmultiLine.find_pair_blocks(lines['Elevel'],lines['z'],lines['a'],self.deltaNeigh,self.blockSize):
+            pairs = pairs[pairs[:,1] >= nCarry] # Pairs entirely inside the carry were counted with an earlier block
+            self.total[kind] += len(pairs)
+            if self.numOut[kind] == 0 or len(pairs) == 0: continue
+
+            # Report each pair with the line that came first in the database first, as the full scan does
+            swap = lines['index'][pairs[:,0]] > lines['index'][pairs[:,1]]
+            pairs[swap] = pairs[swap][:,::-1]
+            minCounts = np.minimum(lines['counts'][pairs[:,0]],lines['counts'][pairs[:,1]])
+            keep = NRFmultiLine.top_pairs(minCounts,lines['index'][pairs[:,0]],lines['index'][pairs[:,1]],self.numOut[kind])
+            best = np.concatenate((self.best[kind],NRFmultiLine.pair_table(lines,pairs[keep],minCounts[keep])))
+            self.best[kind] = best[NRFmultiLine.top_pairs(best['minCounts'],best['index1'],best['index2'],self.numOut[kind])]
+
+        # Later lines have Elevel >= the newest line, so only lines within deltaNeigh of it can still pair
+        bound = lines['Elevel'][-1] - self.deltaNeigh
+        self.carry = lines[lines['Elevel'] >= bound - 4*np.spacing(bound)].copy()
+
+    # Rank the kept pairs, largest counts first and ties by line index, scaling the counts by sourceStrength
+    def finish(self, sourceStrength=1.0):
+        ranked = []
+        for kind in ['branch','neigh']:
+            table = self.best[kind]
+            table = table[np.lexsort((table['index2'],table['index1'],-table['minCounts']))]
+            for field in ['counts1','counts2','minCounts']:
+                table[field] *= sourceStrength
+            ranked.append([table,self.total[kind]])
+        return ranked
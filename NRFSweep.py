@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Parallel parameter sweep for the 1D NRF Parameter Uncertainty Calculator - Python 2.7
+
+# Runs the scan of NRFParamUncertainty_1D.py over every combination of the given energy windows and neighbour gaps
+# The databases are loaded once, memory-mapped from the .nrfcache binary cache, and shared read-only by a pool of
+# worker processes. The top pairs of every scan are collected into one table
+
+import os
+import sys
+import itertools
+import multiprocessing
+import numpy as np
+
+import NRFmultiLine
+import NRFPlot
+from NRFPipeline import NRFPipeline, check_scan_params
+
+# Parameters that can be swept, in the order they appear in the results table
+sweepFields = ['EMin','EMax','bremsMin','bremsMax','neighE']
+
+# One row per ranked pair per scan
+resultDtype = np.dtype([(field,float) for field in sweepFields] +
+                       [('kind','S6'),('rank',np.int32),('z1',np.int32),('a1',np.int32),('z2',np.int32),('a2',np.int32),
+                        ('Elevel1',float),('Elevel2',float),('Egamma1',float),('Egamma2',float),
+                        ('alpha1',float),('alpha2',float),('alphaRatio',float),('minCounts',float)])
+
+# Pipeline and materials shared by the workers. Filled in before the pool starts, so forked workers inherit them
+_shared = {}
+
+# ------ ------ ------
+
+# Function to load everything a scan needs that does not depend on the sweep parameters
+def load_shared(matFile,databaseFile='standalone.dat',NRFile='nonResonantAttenuation.txt',cacheDir=None):
+    if _shared.get('key') == (matFile,databaseFile,NRFile,cacheDir): return _shared
+    pipeline = NRFPipeline(databaseFile,NRFile,cacheDir)
+    materials = pipeline.load_materials(matFile)
+    # The pipeline loads its line database (and the isotope index of a .csv export) lazily. Load them here,
+    # before the pool starts, so forked workers inherit them instead of each parsing the database again
+    pipeline.lines_for(materials.matList)
+    _shared.clear()
+    _shared.update(key=(matFile,databaseFile,NRFile,cacheDir), pipeline=pipeline, materials=materials)
+    return _shared
+
+# Function to expand lists of values for each sweep parameter into every combination of them
+# Combinations the pipeline would reject, such as an empty energy window, are dropped
+def build_grid(EMin,EMax,bremsMin,bremsMax,neighE):
+    grid = []
+    for params in itertools.product(EMin,EMax,bremsMin,bremsMax,neighE):
+        params = dict(zip(sweepFields,params))
+        try:
+            check_scan_params(**params)
+        except ValueError:
+            continue
+        grid.append(params)
+    return grid
+
+# Function to run one scan against the shared databases and return its numPairs best branched and neighbouring pairs
+# If plotPrefix is given the scan's pair plots are also written to <plotPrefix>_branch.png and <plotPrefix>_neigh.png
+def run_scan(params,numPairs,plotPrefix=None):
+    result = _shared['pipeline'].run(_shared['materials'],numBranch=numPairs,numNeigh=numPairs,**params)
+    if plotPrefix != None:
+        NRFPlot.render_pairs(*NRFmultiLine.pair_series(result.emitList,params['neighE']) + (plotPrefix,))
+    return np.concatenate([_pair_rows(result.emitList,result.branchPairs,result.branchCounts,'branch',params),
+                           _pair_rows(result.emitList,result.neighPairs,result.neighCounts,'neigh',params)])
+
+def _pair_rows(emitList,pairs,minCounts,kind,params):
+    table = NRFmultiLine.pair_table(emitList,pairs,minCounts)
+    rows = np.zeros(len(table),dtype=resultDtype)
+    for field in sweepFields: rows[field] = params[field]
+    rows['kind'] = kind
+    rows['rank'] = np.arange(len(table))
+    for field in resultDtype.names[len(sweepFields)+2:]:
+        rows[field] = table[field]
+    return rows
+
+def _init_worker(matFile,databaseFile,NRFile,cacheDir):
+    load_shared(matFile,databaseFile,NRFile,cacheDir) # No-op in forked workers, re-maps the cache otherwise
+
+def _scan_worker(job):
+    return run_scan(*job)
+
+# ------ ------ ------
+
+# Function to run every scan in the grid across a pool of processes and collect the ranked pairs into one table
+# With plotDir each worker also renders its scan's plots to plotDir/scan_<number>_branch.png and _neigh.png
+def sweep(grid,matFile,numPairs=5,processes=None,databaseFile='standalone.dat',NRFile='nonResonantAttenuation.txt',cacheDir=None,plotDir=None):
+    load_shared(matFile,databaseFile,NRFile,cacheDir)
+    if plotDir != None and not os.path.isdir(plotDir): os.makedirs(plotDir)
+    jobs = [(params,numPairs,os.path.join(plotDir,'scan_%04i' % i) if plotDir != None else None) for i, params in enumerate(grid)]
+    if processes == 1 or len(jobs) <= 1:
+        results = [run_scan(*job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes,_init_worker,(matFile,databaseFile,NRFile,cacheDir))
+        try:
+            results = pool.map(_scan_worker,jobs,chunksize=max(1,len(jobs)//(4*(processes or multiprocessing.cpu_count()))))
+        finally:
+            pool.close()
+            pool.join()
+    if len(results) == 0: return np.zeros(0,dtype=resultDtype)
+    return np.concatenate(results)
+
+# Function to write a results table as CSV in a single write
+def write_results(results,fileName):
+    with open(fileName,'w') as outFile:
+        NRFmultiLine.write_csv(results,outFile)
+
+# ------ ------ ------
+
+def _float_list(text):
+    return [float(value) for value in text.split(',')]
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Runs the NRF pair scan over every combination of comma separated values of the energy windows and neighbour gap, in parallel. \nExample:\
+        .......................................................................\
+        $./NRFSweep.py -matList=matList.txt -EMin=0.5,1 -EMax=2.5,4 -bremsMin=2 -bremsMax=9 -neighE=0.001,0.01 -out=sweep.csv \
+        .......................................................................')
+    parser.add_argument('-matList', help='File name of list of isotopes to check and their number densities', type=str)
+    parser.add_argument('-EMin', help='Detector minimum energies (MeV), default = 0 ', type=_float_list, default=[0])
+    parser.add_argument('-EMax', help='Detector maximum energies (MeV), default = 20 ', type=_float_list, default=[20])
+    parser.add_argument('-bremsMin', help='Photon source minimum energies (MeV), default = 0 ', type=_float_list, default=[0])
+    parser.add_argument('-bremsMax', help='Photon source maximum energies (MeV), default = 20 ', type=_float_list, default=[20])
+    parser.add_argument('-neighE', help='Energy gaps to qualify as neighbours (MeV), default = 1KeV ', type=_float_list, default=[0.001])
+    parser.add_argument('-pairsOut', help='Number of branched and neighbouring pairs kept per scan, default = 5 ', type=int, default=5)
+    parser.add_argument('-processes', help='Number of worker processes, default = number of cores ', type=int)
+    parser.add_argument('-out', help='CSV file for the results table, default = sweep.csv ', type=str, default='sweep.csv')
+    parser.add_argument('-plotDir', help='Also render the pair plots of every scan into this directory, numbered in grid order ', type=str)
+    args = parser.parse_args()
+
+    if args.matList == None: sys.exit("User must specify a material file describing the foil and warhead isotopic content")
+    grid = build_grid(args.EMin,args.EMax,args.bremsMin,args.bremsMax,args.neighE)
+    if len(grid) == 0: sys.exit("No valid parameter combinations: check that every maximum energy is above its minimum")
+
+    results = sweep(grid,args.matList,args.pairsOut,args.processes,plotDir=args.plotDir)
+    write_results(results,args.out)
+    print("%i scans, %i ranked pairs written to %s" % (len(grid),len(results),args.out))
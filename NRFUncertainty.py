@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Monte Carlo uncertainties for ranked NRF line pairs - Python 2.7
+
+# For each pair of lines the detector counts are drawn from Poisson distributions about the expected counts, while the
+# nuclear data (Width, prob, GSprob) and number densities used to analyse them are perturbed about their nominal values
+# All samples for all pairs are drawn as (samples x pairs) arrays, in batches, from one seedable RandomState
+#
+# From each sample we work out:
+#    alphaRatio      : foil alpha ratio of the pair, alpha_1/alpha_2, as in the ranked pair tables
+#    warheadRatio    : warhead alpha ratio of the pair
+#    warheadDensity  : warhead number density of the first line's isotope, inferred from the ratio of the pair's counts
+#                      The warhead alphas scale linearly with its density, so log(c1/c2) is linear in the density
+#    foilDensity     : foil number density of the first line's isotope, inferred from the pair's total counts given the
+#                      inferred warhead density, to first order in the foil density
+# Samples giving a non-finite or non-positive density are dropped. When the pair's warhead alphas are nearly equal the
+# inferred densities still have a tail reaching 1e30 and more, so each quantity is summarized by its median, median
+# absolute deviation and percentile interval rather than by a mean and standard deviation
+
+import warnings
+import numpy as np
+
+from NRFLineTable import hbarc
+
+# Default relative (1 sigma) uncertainties of the perturbed parameters
+defaultRelUnc = {'Width':0.10, 'prob':0.05, 'GSprob':0.05, 'nDens':0.02}
+
+# Quantities reported for each pair, and the statistics reported for each
+quantities = ['alphaRatio','warheadRatio','warheadDensity','foilDensity']
+statistics = ['nominal','median','mad','low','high']
+uncertaintyDtype = np.dtype([('index1',np.int64),('index2',np.int64)] + [(q+'_'+stat,float) for q in quantities for stat in statistics])
+
+# ------ ------ ------
+
+# Function to estimate confidence intervals for the quantities above, for pairs (nPairs,2) of emitList indexes
+# emitList is an NRFLineTable with counts already normalized to the source strength
+# relUnc overrides entries of defaultRelUnc, confidence is the central interval reported as [low, high]
+# Samples are kept as float32 (4 quantities x samples x pairs) for the percentiles, and drawn batchSize at a time
+def pair_uncertainty(emitList,pairs,nSamples=10000,seed=None,relUnc=None,confidence=0.68,batchSize=1<<16):
+    pairs = np.asarray(pairs,dtype=int).reshape(-1,2)
+    unc = dict(defaultRelUnc)
+    if relUnc != None: unc.update(relUnc)
+    rng = seed if isinstance(seed,np.random.RandomState) else np.random.RandomState(seed)
+
+    first, second = pairs[:,0], pairs[:,1]
+    lines = [_pair_lines(emitList,first), _pair_lines(emitList,second)]
+    # Lines of the same isotope share one density, lines from the same level also share its Width and GSprob
+    sameIsotope = (emitList.z[first] == emitList.z[second]) & (emitList.a[first] == emitList.a[second])
+    sameLevel = sameIsotope & (emitList.Elevel[first] == emitList.Elevel[second])
+
+    nominal = _analyse(lines,[line['counts'] for line in lines],[dict((k,1.0) for k in unc) for line in lines])
+    samples = dict((q,np.empty((nSamples,len(pairs)),dtype=np.float32)) for q in quantities)
+    for start in range(0,nSamples,batchSize):
+        n = min(batchSize,nSamples-start)
+        shape = (n,len(pairs))
+        factors = [dict((k,_lognormal(rng,unc[k],shape)) for k in unc) for line in lines]
+        for k, shared in (('Width',sameLevel),('GSprob',sameLevel),('nDens',sameIsotope)):
+            factors[1][k] = np.where(shared,factors[0][k],factors[1][k])
+        observed = [rng.poisson(np.broadcast_to(line['counts'],shape)).astype(float) for line in lines]
+        for q, values in zip(quantities,_analyse(lines,observed,factors)):
+            with np.errstate(invalid='ignore'):
+                samples[q][start:start+n] = np.where(np.abs(values) < np.finfo(np.float32).max,values,np.nan) # Don't overflow to inf in float32
+
+    table = np.zeros(len(pairs),dtype=uncertaintyDtype)
+    table['index1'], table['index2'] = emitList.index[first], emitList.index[second]
+    tail = 50.0*(1-confidence)
+    for q, values in zip(quantities,nominal):
+        with warnings.catch_warnings(): # Pairs with no valid samples (e.g. no warhead contrast) just give nan
+            warnings.simplefilter('ignore',RuntimeWarning)
+            table[q+'_nominal'] = values
+            if nSamples > 0:
+                table[q+'_low'], table[q+'_median'], table[q+'_high'] = np.nanpercentile(samples[q],[tail,50,100-tail],axis=0)
+                # Median absolute deviation, scaled to match the standard deviation of a normal distribution
+                table[q+'_mad'] = 1.4826*np.nanmedian(np.abs(samples[q]-table[q+'_median'].astype(np.float32)),axis=0)
+            else:
+                for stat in statistics[1:]: table[q+'_'+stat] = np.nan
+    return table
+
+# Per-line values of a pair member needed to redo the NRFLineTable physics with perturbed inputs
+def _pair_lines(emitList,rows):
+    g = (2.0*emitList.Jr[rows]+1)/(2.0*(2.0*emitList.J0[rows]+1))
+    line = {'strength': 1.0e34 * 2.0 * (np.pi)**2 * g * (hbarc/emitList.Elevel[rows])**2, # sigmaInt per unit Width*GSprob*nDens
+            'Width':emitList.Width[rows], 'prob':emitList.prob[rows], 'GSprob':emitList.GSprob[rows],
+            'nDens':emitList.nDens[rows], 'thickness':emitList.thickness[rows],
+            'sigmaNRLevel':emitList.sigmaNRLevel[rows], 'sigmaNRGamma':emitList.sigmaNRGamma[rows],
+            'counts':emitList.counts[rows]}
+    # The table's counts are normalized to the source strength, keep that factor for the expected counts
+    line['source'] = line['counts'] / _expected(line,dict((k,1.0) for k in defaultRelUnc),1.0)
+    return line
+
+# Attenuation [warhead,foil] of a line with its parameters scaled by factors and its warhead density by warheadScale
+def _alpha(line,factors,warheadScale):
+    nDensScale = factors['nDens']
+    sigmaInt = line['strength'] * line['Width']*factors['Width'] * line['GSprob']*factors['GSprob']
+    sigmaInt = [sigmaInt*line['nDens'][...,0]*nDensScale*warheadScale, sigmaInt*line['nDens'][...,1]*nDensScale]
+    # Non-resonant terms already include the line's own number density, so they scale with it too
+    alphaWarhead = sigmaInt[0] + line['sigmaNRLevel'][...,0]*nDensScale*warheadScale
+    alphaFoil = sigmaInt[1] + (line['sigmaNRLevel'][...,1] + 2*line['sigmaNRGamma'][...,1])*nDensScale
+    return alphaWarhead, alphaFoil, sigmaInt[1]
+
+# Expected counts of a line, without the source strength, as in NRFLineTable
+def _expected(line,factors,warheadScale):
+    alphaWarhead, alphaFoil, sigmaFoil = _alpha(line,factors,warheadScale)
+    prob = np.minimum(line['prob']*factors['prob'],1.0)
+    return np.exp(-alphaWarhead*line['thickness'][...,0]) * prob * sigmaFoil / alphaFoil * (1 - np.exp(-alphaFoil*line['thickness'][...,1]))
+
+# Infer the quantities of interest from observed counts and (perturbed) analysis parameters
+def _analyse(lines,observed,factors):
+    (warhead1, foil1, dummy), (warhead2, foil2, dummy) = _alpha(lines[0],factors[0],1.0), _alpha(lines[1],factors[1],1.0)
+    with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+        # Foil part of the counts, with no warhead in the way
+        foilPart = [line['source']*_expected(line,factor,0.0) for line, factor in zip(lines,factors)]
+        # log(c1/c2) = log(F1/F2) - (alpha_w1 - alpha_w2)*s*t_w, solved for the warhead density scale s
+        warheadScale = (np.log(foilPart[0]/foilPart[1]) - np.log(observed[0]/observed[1])) / ((warhead1-warhead2)*lines[0]['thickness'][...,0])
+        warheadScale = np.where(np.isfinite(warheadScale),warheadScale,np.nan)
+        expected = sum(line['source']*_expected(line,factor,warheadScale) for line, factor in zip(lines,factors))
+        foilScale = (observed[0]+observed[1]) / expected
+        foilScale = np.where(np.isfinite(foilScale),foilScale,np.nan)
+        # Only positive densities are physical, and a foil density inferred from an unphysical warhead density is dropped too
+        physical = warheadScale > 0
+        warheadDensity = np.where(physical,warheadScale*lines[0]['nDens'][...,0],np.nan)
+        foilDensity = np.where(physical & (foilScale > 0),foilScale*lines[0]['nDens'][...,1],np.nan)
+    return foil1/foil2, warhead1/warhead2, warheadDensity, foilDensity
+
+# Multiplicative perturbation with mean 1 and relative spread sigma, always positive
+def _lognormal(rng,sigma,shape):
+    if sigma <= 0: return np.ones(shape)
+    return np.exp(sigma*rng.standard_normal(shape) - 0.5*sigma**2)
+
+# ------ ------ ------
+
+# Function to format an uncertainty table as a printed report, one row per pair
+def format_uncertainty(table,emitList,confidence=0.68):
+    report = ['Pair                    quantity          nominal       median          MAD   [%2.0f%% interval]' % (100*confidence)]
+    for row in table:
+        pair = '[%3i , %3i]-[%3i , %3i]' % (emitList.z[row['index1']],emitList.a[row['index1']],emitList.z[row['index2']],emitList.a[row['index2']])
+        for q in quantities:
+            report.append('%s %-15s %12.5g %12.5g %12.5g [%.5g , %.5g]' % (pair,q,row[q+'_nominal'],row[q+'_median'],row[q+'_mad'],row[q+'_low'],row[q+'_high']))
+            pair = ' '*len(pair)
+    return '\n'.join(report) + '\n'
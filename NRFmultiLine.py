@@ -5,13 +5,17 @@
 # Ruaridh Macdonald, MIT, 2016
 # rmacd@mit.edu
 
+import sys
 import numpy as np
-import matplotlib.pyplot as plt
 import itertools
-import math
 
 import scipy.stats as stat
 
+import NRFDatabase
+import NRFSource
+import NRFInstrument
+from NRFLineTable import NRFLineTable
+
 # ------ ------ ------
 
 # Function to parse material input and give list of isotopes and their densities in the foil and warhead
@@ -25,7 +29,6 @@ def parse_materials(fileName):
     thickList = [] # [warhead,foil] thicknesses (cm)
     
     matFile = open(fileName,'r')
-    print matFile
     
     for isotope in matFile:
         isotope = isotope.strip()
@@ -43,167 +46,408 @@ def parse_materials(fileName):
     
 # ------ ------ ------
     
-# Function to do energy searches
+# Function to do energy searches, accepts a single energy or an array of them
+# Returns the index of the nearest grid energy (the first one if the grid repeats it), like argmin over the grid would
 def find_nearestE(ELevel,NREnergy):
-    idx = (np.abs(NREnergy-ELevel)).argmin()
+    NREnergy = np.ravel(NREnergy)
+    ELevel = np.asarray(ELevel,dtype=float)
+    above = np.clip(np.searchsorted(NREnergy,ELevel,side='left'),1,len(NREnergy)-1)
+    below = above - 1
+    idx = np.where(np.abs(ELevel-NREnergy[below]) <= np.abs(NREnergy[above]-ELevel),below,above)
+    idx = np.searchsorted(NREnergy,NREnergy[idx],side='left')
+    if idx.ndim == 0: return int(idx)
     return idx
 
 # ------ ------ ------
 
-# Function to iterate through pairs in emitList and find the most significant neighbouring and branched peaks, given their NRF cross sections
-def branchNeigh_compare(emitList,deltaNeigh,numBranch,numNeigh,plotOn):
+# Lookup of non-resonant cross sections on the sorted NREnergy grid, with log-log interpolation between grid points
+# Answers whole arrays of energies at once. Absorption edges appear in the table as a repeated (or nearly repeated)
+# energy with the below-edge and above-edge values; an energy exactly on an edge takes the above-edge value and
+# no interpolation ever crosses the jump. Energies outside the grid take the value at the nearest end
+class NRLookup(object):
+    def __init__(self,NREnergy,NRData):
+        NREnergy = np.ravel(NREnergy).astype(float)
+        NRData = np.asarray(NRData,dtype=float)
+        if len(NREnergy) < 2:
+            raise ValueError('NRLookup ERROR: \nNeed at least two grid energies')
+        if np.any(np.diff(NREnergy) < 0):
+            order = np.argsort(NREnergy,kind='mergesort') # Stable, so edge entries keep their below/above order
+            NREnergy, NRData = NREnergy[order], NRData[order]
+        else:
+            order = None
+        self.order = order
+        self.energy = NREnergy
+        self.logEnergy = np.log(NREnergy)
+        self.data = NRData
+
+    # Lower grid index and log-energy fraction of the interval holding each energy
+    # These depend only on the energies, so they can be kept and reused with any data on the same grid
+    def bracket(self,E):
+        logE = np.log(np.asarray(E,dtype=float))
+        lower = np.clip(np.searchsorted(self.logEnergy,logE,side='right')-1,0,len(self.energy)-2)
+        width = self.logEnergy[lower+1] - self.logEnergy[lower]
+        with np.errstate(divide='ignore',invalid='ignore'):
+            fraction = np.where(width > 0,(logE-self.logEnergy[lower])/width,1.0)
+        return lower, np.clip(fraction,0.0,1.0)
+
+    # Put other data on the same grid as the energies this lookup was built on into its sorted order
+    def sorted_data(self,data):
+        data = np.asarray(data,dtype=float)
+        return data if self.order is None else data[self.order]
+
+    # Log-log interpolation of data (default: the table this lookup was built on) at bracketed energies
+    # Intervals with a zero or negative end point fall back to linear interpolation
+    def interpolate(self,lower,fraction,data=None):
+        if data is None: data = self.data
+        low = data[lower]
+        high = data[lower+1]
+        if low.ndim > np.ndim(fraction): fraction = np.reshape(fraction,np.shape(fraction)+(1,)*(low.ndim-np.ndim(fraction)))
+        with np.errstate(divide='ignore',invalid='ignore'):
+            logLog = np.exp(np.log(low) + fraction*(np.log(high)-np.log(low)))
+        return np.where((low > 0) & (high > 0),logLog,low + fraction*(high-low))
+
+    def __call__(self,E,data=None):
+        lower, fraction = self.bracket(E)
+        return self.interpolate(lower,fraction,data)
+
+# ------ ------ ------
+
+# Function to collapse the per-isotope non-resonant cross sections into one attenuation curve per layer
+# NRData column z-1 holds isotope z, nDensList rows are the [warhead,foil] number densities of each isotope in matList
+# Returns an (energies, 2) array of [warhead,foil] attenuation on the NRData energy grid, from a single matrix product
+# The curve only depends on the material list, so it can be built once and shared by every scan using that list
+def mixture_attenuation(NRData,matList,nDensList):
+    columns = np.asarray(matList,dtype=int).reshape(-1,2)[:,0] - 1
+    return np.dot(np.asarray(NRData)[:,columns],np.asarray(nDensList,dtype=float).reshape(-1,2))
+
+# ------ ------ ------
+
+# Function to select the lines of a standalone database array that match the scan and build their NRFLineTable
+# NRMixture is the NRLookup of the [warhead,foil] mixture attenuation curve for the same materials
+# instrument times the filtering and table construction and counts the lines each criterion rejects
+def build_lines(NRFData,matList,nDensList,thickList,NRMixture,EMin,EMax,bremsMin,bremsMax,instrument=NRFInstrument.disabled):
+    with instrument.stage('filter',len(NRFData)):
+        lines, isoIndex = NRFDatabase.filter_lines(NRFData,matList,EMin,EMax,bremsMin,bremsMax,instrument)
     
-    indexListNeigh = [] 
-    alphaListNeigh = []
-    ratioListNeigh = []
-    levelListNeigh = []
-    medsigIntListNeigh = []
-    minCListNeigh = []
-    cListPlotNeigh =  []
-
-    indexListBranch = []
-    eListPlotBranch = []
-    sListPlotBranch = []
-    sTListPlotBranch = []
-    aListPlotBranch = []
-    rListTempBranch = []
-    cListPlotBranch= []
+    with instrument.stage('line_table',len(lines)):
+        # Read the non-resonant attenuation [Warhead,Foil] from all isotopes at each line's energies
+        sigmaNRLevel = NRMixture(lines['Elevel'])   # at the resonance energy
+        sigmaNRGamma = NRMixture(lines['Egamma'])   # at the emitted gamma energy
+        
+        # Bremsstrahlung flux reaching each resonance, from the cached binned spectrum
+        flux = NRFSource.brems_spectrum(bremsMin,bremsMax)(lines['Elevel'])
+        
+        return NRFLineTable(lines['z'],lines['a'],lines['Elevel'],lines['Egamma'],lines['Width'],lines['prob'],lines['GSprob'],lines['J0'],lines['Jr'],lines['TDebye'],
+                            np.asarray(nDensList)[isoIndex],np.asarray(thickList)[isoIndex],sigmaNRLevel,sigmaNRGamma,flux)
+
+# ------ ------ ------
+
+# Function to set the source strength for a set of lines
+# Currently we find the highest intensity NRF peak for each isotope and set the smallest one to be 1e4 counts
+def source_strength(emitList,matList):
+    # Find the largest line for each isotope
+    return strength_from_max(isotope_max_counts(emitList.z,emitList.a,emitList.counts,matList))
+
+# Function to set the source strength from the largest counts of each isotope's lines, as source_strength does
+# Shared with the streaming scan, which builds maxLineCount up a chunk at a time
+def strength_from_max(maxLineCount):
+    # Find smallest of these max lines and set source strength so that this line has 1e4 counts
+    # Isotopes with no lines in the scan are left out rather than dividing by zero. Lines at or above the
+    # bremsstrahlung endpoint get no flux, so if no line has any counts the source strength is left at 1
+    maxLineCount = np.asarray(maxLineCount,dtype=float)
+    if not np.any(maxLineCount > 0): return 1.0
+    return 1e4/maxLineCount[maxLineCount > 0].min()
+
+# Largest counts of any line of each isotope in matList, 0 for isotopes with no lines
+def isotope_max_counts(z,a,counts,matList):
+    maxLineCount = np.zeros(len(matList))
+    np.maximum.at(maxLineCount,NRFDatabase.isotope_index(z,a,matList),counts)
+    return maxLineCount
+
+# ------ ------ ------
+
+# Function to find branched and neighbouring pairs of lines without testing every combination
+# Lines are sorted by Elevel once and a sliding window of width deltaNeigh picks out the neighbours,
+# while branched pairs are found by grouping lines with the same (z, a, Elevel)
+# Returns two (nPairs,2) arrays of positions in the input, ordered as itertools.combinations would order them
+def find_pairs(Elevel,z,a,deltaNeigh):
+    branchPairs = [np.zeros((0,2),dtype=int)]
+    neighPairs = [np.zeros((0,2),dtype=int)]
+    for kind, pairs in find_pair_blocks(Elevel,z,a,deltaNeigh,None):
+        (branchPairs if kind == 'branch' else neighPairs).append(pairs)
+    return _combination_order(np.concatenate(branchPairs)),_combination_order(np.concatenate(neighPairs))
+
+# Generator over the same pairs as find_pairs, in blocks of about blockSize pairs (one block per kind if None)
+# Yields ('branch' or 'neigh', (nPairs,2) array of positions with the lower position first), in no particular order,
+# so the caller never has to hold every pair at once
+def find_pair_blocks(Elevel,z,a,deltaNeigh,blockSize=1<<16):
+    Elevel = np.asarray(Elevel,dtype=float)
+    return pair_blocks(pair_windows(Elevel,z,a,deltaNeigh),Elevel,deltaNeigh,blockSize)
+
+# Function to find the sorted orders and window ends that describe every pair, in O(lines) memory
+# Returns (branchOrder, branchEnd, neighOrder, neighEnd): sorted position k of each order pairs with sorted positions
+# k+1 up to (not including) its end. pair_blocks expands them into the pairs themselves
+def pair_windows(Elevel,z,a,deltaNeigh):
+    Elevel = np.asarray(Elevel,dtype=float)
+    z = np.asarray(z,dtype=int)
+    a = np.asarray(a,dtype=int)
     
-    # Use itertools.combinations to make the smallest list of all combinations of pairs
-    # It doesn't include any duplicates and doesn't pair items with themselves
-    for pair in itertools.combinations(emitList,2):
-        # Neighbouring pairs
-        if abs(pair[0].Elevel-pair[1].Elevel)<=deltaNeigh and pair[0].Elevel != pair[1].Elevel :
-            
-            indexListNeigh.append([pair[0].index, pair[1].index]) # Store indexes of neighbouring pair
-            
-            alphaListNeigh.append(min([pair[0].alpha[1] , pair[1].alpha[1]]))   # Alpha values of pair
-            ratioListNeigh.append(pair[0].alpha[1]/pair[1].alpha[1])            # Alpha ratios of pair
-            levelListNeigh.append(np.median([pair[0].Elevel , pair[1].Elevel])) # Resonance energies of pair
-            medsigIntListNeigh.append(np.median([pair[0].sigmaInt[1]+math.log(1/pair[0].prob), pair[1].sigmaInt[1]+math.log(1/pair[1].prob)]))  # Median NRF cross section of pair
-            minCListNeigh.append(np.min([pair[0].sigmaInt[1]+math.log(1/pair[0].prob) , pair[1].sigmaInt[1]+math.log(1/pair[1].prob)]))    # Minimum NRF cross section of pair
-            cListPlotNeigh.append(np.min([pair[0].counts,pair[1].counts]))
-        # Branched pairs
-        elif pair[0].Elevel == pair[1].Elevel and pair[0].a==pair[1].a and pair[0].z==pair[1].z  :
-            indexListBranch.append([pair[0].index , pair[1].index])
-            aListPlotBranch.append(max([pair[0].alpha[1] , pair[1].alpha[1]]))
-            rListTempBranch.append(pair[0].alpha[1]/pair[1].alpha[1])
-            eListPlotBranch.append(pair[0].Elevel)
-            sTListPlotBranch.append(pair[0].sigmaInt[1]+math.log(1/pair[0].prob))
-            sListPlotBranch.append(min([pair[0].sigmaInt[1] , pair[1].sigmaInt[1]]))
-            cListPlotBranch.append(np.min([pair[0].counts,pair[1].counts]))
+    # No lines, no pairs: the run bookkeeping below needs at least one line
+    if len(Elevel) == 0:
+        empty = np.zeros(0,dtype=int)
+        return empty, empty, empty, empty
     
-    if len(rListTempBranch) == 0:
+    # Branches: lines sharing (z, a, Elevel) form contiguous runs once sorted on that key
+    branchOrder = np.lexsort((Elevel,a,z))
+    newKey = np.ones(len(branchOrder),dtype=bool)
+    newKey[1:] = (np.diff(z[branchOrder]) != 0) | (np.diff(a[branchOrder]) != 0) | (Elevel[branchOrder][1:] != Elevel[branchOrder][:-1])
+    runStart = np.flatnonzero(newKey)
+    runEnd = np.append(runStart[1:],len(branchOrder))
+    
+    # Neighbours: for each line in Elevel order, every later line up to Elevel+deltaNeigh is a candidate
+    # The search bound is padded by a few ulps and the exact test is applied to the candidates in pair_blocks
+    neighOrder = np.argsort(Elevel,kind='mergesort')
+    sortedE = Elevel[neighOrder]
+    bound = sortedE + deltaNeigh
+    neighEnd = np.searchsorted(sortedE,bound+4*np.spacing(bound),side='right')
+    return branchOrder, np.repeat(runEnd,runEnd-runStart), neighOrder, neighEnd
+
+# Generator expanding the windows from pair_windows into blocks of pairs, as find_pair_blocks yields them
+# Which lines pair up only depends on Elevel, z, a and deltaNeigh, so the windows can be kept and expanded again
+def pair_blocks(windows,Elevel,deltaNeigh,blockSize=1<<16):
+    branchOrder, branchEnd, neighOrder, neighEnd = windows
+    for first, second in _window_blocks(branchOrder,branchEnd,blockSize):
+        yield 'branch', _low_high(first,second)
+    for first, second in _window_blocks(neighOrder,neighEnd,blockSize):
+        gap = np.abs(Elevel[first]-Elevel[second])
+        keep = (gap <= deltaNeigh) & (Elevel[first] != Elevel[second])
+        yield 'neigh', _low_high(first[keep],second[keep])
+
+# Expand windows over a sorted order into explicit pairs, a block of about blockSize pairs at a time
+# Sorted position k is paired with every sorted position from k+1 up to (not including) windowEnd[k]
+def _window_blocks(order,windowEnd,blockSize):
+    n = len(order)
+    nPairs = np.maximum(windowEnd - np.arange(n) - 1,0)
+    if blockSize == None:
+        yield _window_pairs(order,nPairs,0,n)
+        return
+    # Split the sorted positions so each block holds about blockSize pairs, and at least one position
+    ends = np.unique(np.append(np.searchsorted(np.cumsum(nPairs),np.arange(blockSize,nPairs.sum(),blockSize),side='right'),n))
+    start = 0
+    for end in ends:
+        end = max(end,start+1)
+        if end > n: break
+        yield _window_pairs(order,nPairs,start,end)
+        start = end
+
+def _window_pairs(order,nPairs,start,stop):
+    nPairs = nPairs[start:stop]
+    first = np.repeat(np.arange(start,stop),nPairs)
+    offset = np.arange(nPairs.sum()) - np.repeat(np.cumsum(nPairs)-nPairs,nPairs) + 1
+    return order[first],order[first+offset]
+
+def _low_high(first,second):
+    return np.column_stack((np.minimum(first,second),np.maximum(first,second))).astype(int).reshape(-1,2)
+
+# Put pairs of positions into the order itertools.combinations uses: (i,j) with i<j, sorted by i then j
+def _combination_order(pairs):
+    return pairs[np.lexsort((pairs[:,1],pairs[:,0]))]
+
+# Function to check find_pairs against the itertools.combinations loop it replaced, on the same lines
+# Returns True when both give the same branched and neighbouring pairs in the same order. Tests every pair, so keep the set small
+def check_pairs(Elevel,z,a,deltaNeigh):
+    branchPairs, neighPairs = find_pairs(Elevel,z,a,deltaNeigh)
+    branchRef, neighRef = [], []
+    for i, j in itertools.combinations(range(len(Elevel)),2):
+        if abs(Elevel[i]-Elevel[j]) <= deltaNeigh and Elevel[i] != Elevel[j]:
+            neighRef.append([i,j])
+        elif Elevel[i] == Elevel[j] and a[i] == a[j] and z[i] == z[j]:
+            branchRef.append([i,j])
+    return branchPairs.tolist() == branchRef and neighPairs.tolist() == neighRef
+
+# ------ ------ ------
+
+# Function to rank the branched and neighbouring pairs of a line table by the minimum counts of each pair, largest first
+# Keeps the top numBranch / numNeigh pairs (all of them if None). Pairs are generated in blocks and only the current best
+# candidates are kept between blocks, selected with argpartition, so memory grows with the number kept, not with the pairs
+# Returns [branchPairs, branchCounts, nBranch], [neighPairs, neighCounts, nNeigh] with the pairs as (nPairs,2) arrays of
+# emitList indexes and nBranch / nNeigh the total number of pairs of each kind that were found
+def rank_pairs(emitList,deltaNeigh,numBranch=None,numNeigh=None,blockSize=1<<16):
+    return rank_pair_blocks(find_pair_blocks(emitList.Elevel,emitList.z,emitList.a,deltaNeigh,blockSize),emitList.counts,emitList.index,numBranch,numNeigh)
+
+# Function to rank pairs arriving in ('branch' or 'neigh', pairs) blocks, as from find_pair_blocks, by the counts of their lines
+# Which lines pair up doesn't depend on the counts, so the windows behind the blocks can be kept and ranked again with new counts
+def rank_pair_blocks(blocks,counts,index,numBranch=None,numNeigh=None):
+    counts = np.asarray(counts)
+    numOut = {'branch':numBranch, 'neigh':numNeigh}
+    best = {'branch':[np.zeros((0,2),dtype=int),np.zeros(0)], 'neigh':[np.zeros((0,2),dtype=int),np.zeros(0)]}
+    total = {'branch':0, 'neigh':0}
+    for kind, pairs in blocks:
+        total[kind] += len(pairs)
+        if numOut[kind] == 0 or len(pairs) == 0: continue
+        minCounts = np.concatenate((best[kind][1],np.minimum(counts[pairs[:,0]],counts[pairs[:,1]])))
+        pairs = np.concatenate((best[kind][0],pairs))
+        keep = top_pairs(minCounts,pairs[:,0],pairs[:,1],numOut[kind])
+        pairs, minCounts = pairs[keep], minCounts[keep]
+        best[kind] = [pairs,minCounts]
+    
+    ranked = []
+    for kind in ['branch','neigh']:
+        pairs, minCounts = best[kind]
+        order = np.lexsort((pairs[:,1],pairs[:,0],-minCounts)) # Largest counts first, ties in combinations order
+        ranked.append([np.asarray(index)[pairs[order]],minCounts[order],total[kind]])
+    return ranked
+
+# Positions of the numOut pairs (all if None) with the largest minCounts, in no particular order
+# Ties are settled on (first, second), smallest first, as the final ranking orders them, so the pairs kept at the
+# cut never depend on how the pairs were split into blocks. argpartition finds the cut, then every pair tied with it is
+# kept and only those candidates are sorted
+def top_pairs(minCounts,first,second,numOut):
+    if numOut == None or len(minCounts) <= numOut: return np.arange(len(minCounts))
+    cut = -np.partition(-minCounts,numOut-1)[numOut-1]
+    candidates = np.flatnonzero(minCounts >= cut)
+    if len(candidates) == numOut: return candidates
+    order = np.lexsort((second[candidates],first[candidates],-minCounts[candidates]))
+    return candidates[order[:numOut]]
+
+# ------ ------ ------
+
+# Function to describe ranked pairs as a table with one row per pair, taking every value from the line columns at once
+# pairs are positions in emitList, the table reports each line's own index
+def pair_table(emitList,pairs,minCounts):
+    pairs = np.asarray(pairs,dtype=int).reshape(-1,2)
+    columns = _line_columns(emitList)
+    table = np.zeros(len(pairs),dtype=pairDtype)
+    for k, suffix in enumerate(['1','2']):
+        rows = pairs[:,k]
+        for field in ['index','z','a','Elevel','Egamma','prob','counts']:
+            table[field+suffix] = columns[field][rows]
+        table['alpha'+suffix] = columns['alpha'][rows,1]
+    table['alphaRatio'] = table['alpha1']/table['alpha2']
+    table['minCounts'] = minCounts
+    return table
+
+pairDtype = np.dtype([('index1',np.int64),('index2',np.int64),('z1',np.int32),('a1',np.int32),('z2',np.int32),('a2',np.int32),
+                      ('Elevel1',float),('Elevel2',float),('Egamma1',float),('Egamma2',float),('prob1',float),('prob2',float),
+                      ('alpha1',float),('alpha2',float),('alphaRatio',float),('counts1',float),('counts2',float),('minCounts',float)])
+
+# Columns of a line table or a structured array of lines, or the same built from a list of NRFGamma-like objects
+def _line_columns(emitList):
+    if isinstance(emitList,NRFLineTable): return emitList.__dict__
+    if isinstance(emitList,np.ndarray) and emitList.dtype.names != None: return emitList
+    columns = {}
+    for field in ['z','a','Elevel','Egamma','prob','counts','alpha','sigmaInt','index']:
+        columns[field] = np.array([getattr(line,field) for line in emitList])
+    return columns
+
+# Function to write a pair table (or any structured array) as CSV, in a single write
+def write_csv(table,outFile):
+    body = ''.join(','.join(str(value) for value in row) + '\n' for row in table.tolist())
+    outFile.write(','.join(table.dtype.names) + '\n' + body)
+
+# Function to format the top pairs of one kind as the printed report, nFound being the total number of pairs found
+def format_pairs(table,kind,numOut,nFound):
+    name = 'branched' if kind == 'branch' else 'neighbouring'
+    if nFound == 0: return '\nNo %s pairs\n' % name
+    if len(table) < numOut: report = ['\nOnly %i %s pairs found' % (nFound,name)]
+    else: report = ['\nFound %i %s pairs' % (nFound,name)]
+    if kind == 'branch':
+        report.append('The %i branched pairs with largest total NRF attenuation coefficient: \n  Isotope    mu_NRF[b] branch ratio Elevel[MeV]    EGamma[MeV]          alpha     alpha_ratio  counts' % numOut)
+        rowFormat = '[{z1:3.0f} , {a1:3.0f}] {minCounts:6.3f}  [{prob1:4.2f} , {prob2:4.2f}] {Elevel1:8.3f}    [{Egamma1:6.3f} , {Egamma2:6.3f}] [{alpha1:6.2f} , {alpha2:6.2f}] {alphaRatio:6.3f} {counts2:10.2f}'
+    else:
+        report.append('The %i neighbouring pairs with largest minimum( mu_NRF of pair ): \n  Istope_1   Isotope_2  mu_NRF[b]  ELevel [MeV]    EGamma [MeV]        alpha     alpha_ratio counts' % numOut)
+        rowFormat = '[{z1:3.0f} , {a1:3.0f}] [{z2:3.0f} , {a2:3.0f}] {minCounts:6.4f}  [{Elevel1:5.2f} , {Elevel2:5.2f}] [{Egamma1:5.2f} , {Egamma2:5.2f}] [{alpha1:6.2f} , {alpha2:6.2f}] {alphaRatio:6.3f} {counts2:10.2f}'
+    names = table.dtype.names
+    report.extend(rowFormat.format(**dict(zip(names,row))) for row in table.tolist())
+    return '\n'.join(report) + '\n'
+
+# ------ ------ ------
+
+# Function to find every branched and neighbouring pair of emitList and the per-pair series that describe them
+# Pairs come back in the same order as itertools.combinations(emitList,2) would give them
+# Returns two dicts of arrays, branched then neighbouring, with one entry per pair:
+#    index  : (nPairs,2) line indexes of the pair
+#    energy : resonance energy (first line's for branched pairs, mean of the pair for neighbours)
+#    alpha  : foil alpha of the pair (largest for branched pairs, smallest for neighbours)
+#    ratio  : foil alpha ratio alpha_1/alpha_2
+#    sigma  : smallest foil sigmaInt for branched pairs, mean sigma_NRF (sigmaInt + log(1/prob)) for neighbours
+#    minSigma : smallest sigma_NRF of the pair
+#    counts : smallest counts of the pair
+def pair_series(emitList,deltaNeigh):
+    # Per-line quantities used to describe the pairs, read straight from the columns of an NRFLineTable
+    if isinstance(emitList,NRFLineTable):
+        alphaFoil = emitList.alpha[:,1]
+        sigmaFoil = emitList.sigmaInt[:,1]
+        probs     = emitList.prob
+        levels    = emitList.Elevel
+        counts    = emitList.counts
+        indexes   = emitList.index
+        branchPairs, neighPairs = find_pairs(levels,emitList.z,emitList.a,deltaNeigh)
+    else:
+        alphaFoil = np.array([line.alpha[1] for line in emitList],dtype=float)
+        sigmaFoil = np.array([line.sigmaInt[1] for line in emitList],dtype=float)
+        probs     = np.array([line.prob for line in emitList],dtype=float)
+        levels    = np.array([line.Elevel for line in emitList],dtype=float)
+        counts    = np.array([line.counts for line in emitList],dtype=float)
+        indexes   = np.array([line.index for line in emitList],dtype=int)
+        branchPairs, neighPairs = find_pairs(levels,[line.z for line in emitList],[line.a for line in emitList],deltaNeigh)
+    sigmaTot = sigmaFoil + np.log(1/probs)
+    
+    first, second = branchPairs[:,0], branchPairs[:,1]
+    branchSeries = {'index':np.column_stack((indexes[first],indexes[second])),
+                    'energy':levels[first],
+                    'alpha':np.maximum(alphaFoil[first],alphaFoil[second]),
+                    'ratio':alphaFoil[first]/alphaFoil[second],
+                    'sigma':np.minimum(sigmaFoil[first],sigmaFoil[second]),
+                    'minSigma':np.minimum(sigmaTot[first],sigmaTot[second]),
+                    'counts':np.minimum(counts[first],counts[second])}
+    
+    first, second = neighPairs[:,0], neighPairs[:,1]
+    neighSeries = {'index':np.column_stack((indexes[first],indexes[second])),
+                   'energy':(levels[first]+levels[second])/2,
+                   'alpha':np.minimum(alphaFoil[first],alphaFoil[second]),
+                   'ratio':alphaFoil[first]/alphaFoil[second],
+                   'sigma':(sigmaTot[first]+sigmaTot[second])/2,
+                   'minSigma':np.minimum(sigmaTot[first],sigmaTot[second]),
+                   'counts':np.minimum(counts[first],counts[second])}
+    return branchSeries, neighSeries
+
+# Function to iterate through pairs in emitList and find the most significant neighbouring and branched peaks, given their NRF cross sections
+# Plots are no longer drawn here: pass the series from pair_series to NRFPlot. plotOn is kept for older callers
+def branchNeigh_compare(emitList,deltaNeigh,numBranch,numNeigh,plotOn=0):
+    branchSeries, neighSeries = pair_series(emitList,deltaNeigh)
+    # Kinds with no number of pairs to report come back empty
+    branchData, neighData = [], []
+    
+    if len(branchSeries['ratio']) == 0:
         print('\nNo branched pairs')
-        if plotOn == 1:
-            plt.figure(1)
-            plt.clf()
-            plt.suptitle('No branched pairs', fontsize=24)
-        branchData = []
         
     else:
         # Find and print list of most significant branched lines based on cross section
         if numBranch != None:
             
-            minCListBranch = np.array(cListPlotBranch)
-            minCListBranchIndex = np.argsort(minCListBranch)[::-1]
+            minCListBranch = branchSeries['counts']
+            minCListBranchIndex = np.argsort(-minCListBranch,kind='mergesort') # Largest first, ties in combinations order
             
-            branchData = [indexListBranch,aListPlotBranch,eListPlotBranch,minCListBranch,minCListBranchIndex]
-
-            if len(minCListBranch) < numBranch: 
-                print('\nOnly %i branched pairs found' %len(minCListBranch))
-                print('The %i branched pairs with largest total NRF attenuation coefficient: \n  Isotope    mu_NRF[b] branch ratio Elevel[MeV]    EGamma[MeV]          alpha     alpha_ratio  counts' % numBranch)
-                for i in range(len(minCListBranch)):
-                    print "[%s , %s] %s  [%s , %s] %s    [%s , %s] [%s , %s] %s %s" % ("{:3.0f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].z), "{:3.0f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].a), "{:6.3f}".format(minCListBranch[minCListBranchIndex[i]]), "{:4.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].prob), "{:4.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][1]].prob), "{:8.3f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].Elevel), "{:6.3f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].Egamma), "{:6.3f}".format(emitList[indexListBranch[minCListBranchIndex[i]][1]].Egamma), "{:6.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].alpha[1]), "{:6.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][1]].alpha[1]), "{:6.3f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].alpha[1]/emitList[indexListBranch[minCListBranchIndex[i]][1]].alpha[1]), "{:10.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][1]].counts))
-            else:
-                print('\nFound %i neighbouring pairs' %len(minCListBranch) )
-                print('The %i branched pairs with largest total NRF attenuation coefficient: \n  Isotope    mu_NRF[b] branch ratio Elevel[MeV]    EGamma[MeV]          alpha     alpha_ratio  counts' % numBranch)
-                for i in range(numBranch):
-                    print "[%s , %s] %s  [%s , %s] %s    [%s , %s] [%s , %s] %s %s" % ("{:3.0f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].z), "{:3.0f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].a), "{:6.3f}".format(minCListBranch[minCListBranchIndex[i]]), "{:4.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].prob), "{:4.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][1]].prob), "{:8.3f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].Elevel), "{:6.3f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].Egamma), "{:6.3f}".format(emitList[indexListBranch[minCListBranchIndex[i]][1]].Egamma), "{:6.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].alpha[1]), "{:6.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][1]].alpha[1]), "{:6.3f}".format(emitList[indexListBranch[minCListBranchIndex[i]][0]].alpha[1]/emitList[indexListBranch[minCListBranchIndex[i]][1]].alpha[1]), "{:10.2f}".format(emitList[indexListBranch[minCListBranchIndex[i]][1]].counts))
-              
-                if plotOn == 1:
-                    plt.figure(1)
-                    plt.clf()
-                    plt.suptitle('Branched emissions', fontsize=18)
-                    plt.subplot(221)
-                    plt.semilogy(eListPlotBranch,aListPlotBranch,'.k')
-                    plt.tick_params(axis='both', which='major', labelsize=14)
-                    plt.xlabel('Resonance energy (MeV)',fontsize=18)
-                    plt.ylabel('$\\alpha_{0,1}$ (b)',fontsize=24)
-                    plt.subplot(222)
-                    plt.semilogy(eListPlotBranch,rListTempBranch,'.k')
-                    plt.semilogy([0,max(eListPlotBranch)],[1,1],'--r')
-                    plt.tick_params(axis='both', which='major', labelsize=14)
-                    plt.xlabel('Resonance energy (MeV)',fontsize=18)
-                    plt.ylabel('$\\frac{\\alpha_{0,1}}{\\alpha_{0,2}}$',fontsize=40)
-                    plt.subplot(223)
-                    plt.semilogy(sListPlotBranch,rListTempBranch,'.k')
-                    plt.semilogy([0,max(sListPlotBranch)],[1,1],'--r')
-                    plt.tick_params(axis='both', which='major', labelsize=14)
-                    plt.xlabel('Min B$*\sigma_{NRF}$ (b)',fontsize=18)
-                    plt.ylabel('$\\frac{\\alpha_{0,1}}{\\alpha_{0,2}}$',fontsize=40)
-                    plt.subplot(224)
-                    plt.semilogy(minCListBranch,rListTempBranch,'.k')
-                    plt.semilogy([0,max(minCListBranch)],[1,1],'--r')
-                    plt.tick_params(axis='both', which='major', labelsize=14)
-                    plt.xlabel('$\sigma_{NRF}$ (b)',fontsize=18)
-                    plt.ylabel('$\\frac{\\alpha_{0,1}}{\\alpha_{0,2}}$',fontsize=40)
-                    plt.show()
+            branchData = [branchSeries['index'].tolist(),branchSeries['alpha'].tolist(),branchSeries['energy'].tolist(),minCListBranch,minCListBranchIndex]
+
+            # Report the top pairs as one pre-formatted table, in a single write
+            top = minCListBranchIndex[:numBranch]
+            sys.stdout.write(format_pairs(pair_table(emitList,branchSeries['index'][top],minCListBranch[top]),'branch',numBranch,len(minCListBranch)))
             
-    if len(ratioListNeigh) == 0:
+    if len(neighSeries['ratio']) == 0:
         print('\nNo neighbouring pairs')
-        neighData = []
-        if plotOn == 1:
-            plt.figure(2)
-            plt.clf()
-            plt.suptitle('No neighbouring pairs', fontsize=24)
     else:
         # Print list of most significant neighbouring lines, by counts
         if numNeigh != None:
             
-            minCListNeigh = np.array(cListPlotNeigh)
-            minCListNeighIndex = np.argsort(minCListNeigh)[::-1]
-
-            neighData = [indexListNeigh,alphaListNeigh,levelListNeigh,minCListNeigh,minCListNeighIndex]
-
-            if len(minCListNeigh) < numNeigh: 
-                print('\nOnly %i neighbouring pairs found' %len(minCListNeigh))
-                print('The %i neighbouring pairs with largest minimum( mu_NRF of pair ): \n  Istope_1   Isotope_2  mu_NRF[b]  ELevel [MeV]    EGamma [MeV]        alpha     alpha_ratio counts' % numNeigh)
-                for i in range(len(minCListNeigh)):
-                    print "[%s , %s] [%s , %s] %s  [%s , %s] [%s , %s] [%s , %s] %s %s" %("{:3.0f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].z),"{:3.0f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].a),"{:3.0f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].z),"{:3.0f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].a), "{:6.4f}".format(minCListNeigh[minCListNeighIndex[i]]), "{:5.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].Elevel), "{:5.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].Elevel), "{:5.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].Egamma), "{:5.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].Egamma), "{:6.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].alpha[1]), "{:6.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].alpha[1]), "{:6.3f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].alpha[1]/emitList[indexListNeigh[minCListNeighIndex[i]][1]].alpha[1]), "{:10.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].counts)  )
-            else:
-                print('\nFound %i neighbouring pairs' % len(minCListNeigh))
-                print('The %i neighbouring pairs with largest minimum( mu_NRF of pair ): \n  Istope_1   Isotope_2  mu_NRF[b]  ELevel [MeV]    EGamma [MeV]        alpha     alpha_ratio counts' % numNeigh)
-                for i in range(numNeigh):
-                    print "[%s , %s] [%s , %s] %s  [%s , %s] [%s , %s] [%s , %s] %s %s" %("{:3.0f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].z),"{:3.0f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].a),"{:3.0f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].z),"{:3.0f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].a), "{:6.4f}".format(minCListNeigh[minCListNeighIndex[i]]), "{:5.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].Elevel), "{:5.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].Elevel), "{:5.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].Egamma), "{:5.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].Egamma), "{:6.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].alpha[1]), "{:6.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].alpha[1]), "{:6.3f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][0]].alpha[1]/emitList[indexListNeigh[minCListNeighIndex[i]][1]].alpha[1]), "{:10.2f}".format(emitList[indexListNeigh[minCListNeighIndex[i]][1]].counts) )
-               
-                if plotOn == 1:
-                    plt.figure(2)
-                    plt.clf()
-                    plt.suptitle('Neighbouring emissions', fontsize=18)
-                    plt.subplot(221)
-                    plt.semilogy(levelListNeigh,alphaListNeigh,'.k')
-                    plt.tick_params(axis='both', which='major', labelsize=14)
-                    plt.xlabel('Resonance Energy (MeV)',fontsize=18)
-                    plt.ylabel('Min$(\\alpha_{0,1},\\alpha_{2,3})$',fontsize=18)
-                    plt.subplot(222)
-                    plt.semilogy(levelListNeigh,ratioListNeigh,'.k')
-                    plt.semilogy([0,max(levelListNeigh)],[1,1],'--r')
-                    plt.tick_params(axis='both', which='major', labelsize=14)
-                    plt.xlabel('Resonance Energy (MeV)',fontsize=18)
-                    plt.ylabel('$\\frac{\\alpha_{0,1}}{\\alpha_{2,3}}$',fontsize=40)
-                    plt.subplot(223)
-                    plt.semilogy(medsigIntListNeigh,ratioListNeigh,'.k')
-                    plt.semilogy([0,max(medsigIntListNeigh)],[1,1],'--r')
-                    plt.tick_params(axis='both', which='major', labelsize=14)
-                    plt.xlabel('Median $\sigma_{NRF}$ (b)',fontsize=18)
-                    plt.ylabel('$\\frac{\\alpha_{0,1}}{\\alpha_{2,3}}$',fontsize=40)
-                    plt.subplot(224)
-                    plt.semilogy(minCListNeigh,ratioListNeigh,'.k')
-                    plt.semilogy([0,max(minCListNeigh)],[1,1],'--r')
-                    plt.tick_params(axis='both', which='major', labelsize=14)
-                    plt.xlabel('Min $\sigma_{NRF}$ (b)',fontsize=18)
-                    plt.ylabel('$\\frac{\\alpha_{0,1}}{\\alpha_{2,3}}$',fontsize=40)
-                    plt.show()
-
-    return branchData,neighData
\ No newline at end of file
+            minCListNeigh = neighSeries['counts']
+            minCListNeighIndex = np.argsort(-minCListNeigh,kind='mergesort') # Largest first, ties in combinations order
+
+            neighData = [neighSeries['index'].tolist(),neighSeries['alpha'].tolist(),neighSeries['energy'].tolist(),minCListNeigh,minCListNeighIndex]
+
+            # Report the top pairs as one pre-formatted table, in a single write
+            top = minCListNeighIndex[:numNeigh]
+            sys.stdout.write(format_pairs(pair_table(emitList,neighSeries['index'][top],minCListNeigh[top]),'neigh',numNeigh,len(minCListNeigh)))
+
+    return branchData,neighData